@@ -1,8 +1,21 @@
-
 import os
+import re
 import json
+import math
+import time
+import heapq
+import itertools
+import random
+import hashlib
+import sqlite3
 import logging
+import threading
 import requests
+from requests.adapters import HTTPAdapter
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from cache import CACHE_DB_PATH, FlightAbandoned, LRUCache, SingleFlight, SQLiteCache, TieredCache
+from metrics import record_stage, registry, timer
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -11,14 +24,118 @@ logger = logging.getLogger(__name__)
 # Ollama configuration
 OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")
 OLLAMA_MODEL = os.environ.get("OLLAMA_MODEL", "mistral")
+OLLAMA_EMBED_MODEL = os.environ.get("OLLAMA_EMBED_MODEL", "nomic-embed-text")
+OLLAMA_KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "5m")
+OLLAMA_POOL_SIZE = int(os.environ.get("OLLAMA_POOL_SIZE", 10))
+OLLAMA_CONNECT_TIMEOUT = float(os.environ.get("OLLAMA_CONNECT_TIMEOUT", 5))
+OLLAMA_READ_TIMEOUT = float(os.environ.get("OLLAMA_READ_TIMEOUT", 300))
+OLLAMA_MAX_RETRIES = int(os.environ.get("OLLAMA_MAX_RETRIES", 3))
+OLLAMA_BACKOFF_BASE = float(os.environ.get("OLLAMA_BACKOFF_BASE", 0.5))
+OLLAMA_BACKOFF_MAX = float(os.environ.get("OLLAMA_BACKOFF_MAX", 8))
 
-def analyze_document(text, is_summary=False):
-    """Analyze document content using Ollama"""
-    try:
-        # Format the prompt based on whether this is a summary request or full analysis
-        if is_summary:
-            prompt = """
-            Summarize this research paper's title and abstract concisely. 
+# Scheduler configuration
+OLLAMA_MAX_CONCURRENCY = int(os.environ.get("OLLAMA_MAX_CONCURRENCY", 2))
+OLLAMA_QUEUE_TIMEOUT = float(os.environ.get("OLLAMA_QUEUE_TIMEOUT", 120))
+
+# Priority classes, lower runs first
+PRIORITY_SUMMARY = 0
+PRIORITY_ANALYSIS = 1
+PRIORITY_BATCH = 2
+
+OLLAMA_QUEUE_LIMITS = {
+    PRIORITY_SUMMARY: int(os.environ.get("OLLAMA_QUEUE_LIMIT_SUMMARY", 16)),
+    PRIORITY_ANALYSIS: int(os.environ.get("OLLAMA_QUEUE_LIMIT_ANALYSIS", 8)),
+    PRIORITY_BATCH: int(os.environ.get("OLLAMA_QUEUE_LIMIT_BATCH", 32)),
+}
+
+# Response cache configuration
+LLM_CACHE_ENABLED = os.environ.get("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", 1024))
+LLM_CACHE_TTL = int(os.environ.get("LLM_CACHE_TTL", 7 * 24 * 3600))
+
+# Long document configuration
+ANALYSIS_CHUNK_TOKENS = int(os.environ.get("ANALYSIS_CHUNK_TOKENS", 3000))
+ANALYSIS_MAP_WORKERS = int(os.environ.get("ANALYSIS_MAP_WORKERS", 4))
+CHARS_PER_TOKEN = 4
+
+SYSTEM_PROMPT = "You are a research paper analysis assistant. Always respond with valid JSON."
+
+prompt_tokens = registry.counter('ollama_prompt_tokens_total', 'Prompt tokens evaluated by Ollama', ('model',))
+completion_tokens = registry.counter('ollama_completion_tokens_total', 'Tokens generated by Ollama', ('model',))
+tokens_per_second = registry.histogram('ollama_tokens_per_second', 'Generation speed reported by Ollama',
+                                       ('model',), buckets=(1, 2, 5, 10, 20, 35, 50, 75, 100, 150, 250, 500))
+
+_HEADING_RE = re.compile(
+    r'^\s*(?:'
+    r'\d+(?:\.\d+)*\.?\s+[A-Z][^\n]{0,80}'
+    r'|[A-Z][A-Z0-9 ,:&\-]{2,80}'
+    r'|(?:Abstract|Introduction|Background|Related Work|Methods?|Methodology|'
+    r'Experiments?|Results|Discussion|Conclusions?|References|Acknowledg(?:e)?ments)\b[^\n]{0,40}'
+    r')\s*$',
+    re.MULTILINE
+)
+
+def _split_sections(text):
+    starts = [m.start() for m in _HEADING_RE.finditer(text)]
+    bounds = [0] + [s for s in starts if s > 0] + [len(text)]
+    return [text[a:b] for a, b in zip(bounds, bounds[1:])]
+
+# Progressively finer boundaries used to split text that is over budget
+_SPLITTERS = [
+    _split_sections,
+    lambda text: re.split(r'\n\s*\n', text),
+    lambda text: text.split('\n'),
+    lambda text: re.split(r'(?<=[.!?])\s+', text),
+]
+
+def estimate_tokens(text):
+    """Cheap token estimate used for chunk budgeting"""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def _split_to_budget(text, max_tokens, level=0):
+    if estimate_tokens(text) <= max_tokens:
+        return [text]
+    if level == len(_SPLITTERS):
+        size = max(max_tokens * CHARS_PER_TOKEN - 1, 1)
+        return [text[i:i + size] for i in range(0, len(text), size)]
+
+    pieces = [piece for piece in _SPLITTERS[level](text) if piece.strip()]
+    if len(pieces) <= 1:
+        return _split_to_budget(text, max_tokens, level + 1)
+
+    result = []
+    for piece in pieces:
+        result.extend(_split_to_budget(piece, max_tokens, level + 1))
+    return result
+
+def chunk_text(text, max_tokens=ANALYSIS_CHUNK_TOKENS):
+    """Split text into chunks of at most max_tokens (estimated) tokens.
+
+    Splits prefer section headings, then paragraphs, lines and sentences, and
+    adjacent small pieces are packed together up to the budget.
+    """
+    chunks = []
+    current = []
+    current_chars = 0
+    for piece in _split_to_budget(text, max_tokens):
+        piece = piece.strip()
+        # Estimate the chunk as it would be joined, separators included, before adding the piece
+        joined_chars = current_chars + len('\n\n') + len(piece) if current else len(piece)
+        if current and joined_chars // CHARS_PER_TOKEN + 1 > max_tokens:
+            chunks.append('\n\n'.join(current))
+            current = []
+            joined_chars = len(piece)
+        current.append(piece)
+        current_chars = joined_chars
+    if current:
+        chunks.append('\n\n'.join(current))
+    return chunks
+
+def build_prompt(text, is_summary=False, part=None):
+    """Format the prompt based on whether this is a summary request or full analysis"""
+    if is_summary:
+        return """
+            Summarize this research paper's title and abstract concisely.
             Focus on the main contributions and findings.
 
             Respond with JSON in this format:
@@ -29,8 +146,12 @@ def analyze_document(text, is_summary=False):
 
             Here's the paper to summarize:
             """ + text
-        else:
-            prompt = """
+
+    if part:
+        intro = f"Here's part {part[0]} of {part[1]} of the document to analyze:"
+    else:
+        intro = "Here's the document to analyze:"
+    return """
             Analyze this research document and provide a detailed analysis including:
             - summary
             - key points
@@ -47,59 +168,526 @@ def analyze_document(text, is_summary=False):
                 "citations": ["citation 1", "citation 2", ...]
             }
 
-            Here's the document to analyze:
-            """ + text
+            """ + intro + "\n" + text
+
+class OllamaClient:
+    """Thread-safe, connection-pooled client for the Ollama HTTP API.
+
+    Connection failures and 429/502/503/504 responses are retried with
+    full-jitter exponential backoff. Read timeouts are not retried, since the
+    generation may still be running on the server.
+    """
+
+    RETRY_STATUSES = {429, 502, 503, 504}
+
+    def __init__(self, base_url=OLLAMA_BASE_URL, model=OLLAMA_MODEL,
+                 pool_size=OLLAMA_POOL_SIZE, connect_timeout=OLLAMA_CONNECT_TIMEOUT,
+                 read_timeout=OLLAMA_READ_TIMEOUT, max_retries=OLLAMA_MAX_RETRIES,
+                 backoff_base=OLLAMA_BACKOFF_BASE, backoff_max=OLLAMA_BACKOFF_MAX,
+                 keep_alive=OLLAMA_KEEP_ALIVE):
+        self.base_url = base_url.rstrip('/')
+        self.model = model
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.keep_alive = keep_alive
+
+        self.session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/json"})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _backoff(self, attempt):
+        time.sleep(random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt)))
+
+    def post(self, path, payload, stream=False):
+        """POST to the Ollama API, retrying transient failures"""
+        url = f"{self.base_url}{path}"
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self._backoff(attempt - 1)
+            try:
+                logger.debug(f"Sending request to Ollama API at {url} (attempt {attempt + 1})")
+                response = self.session.post(url, json=payload, timeout=self.timeout, stream=stream)
+            except requests.exceptions.ReadTimeout:
+                raise ConnectionError(f"Ollama did not respond within {self.timeout[1]}s")
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                last_error = str(e)
+                logger.warning(f"Ollama request failed: {last_error}")
+                continue
+
+            if response.status_code == 200:
+                return response
+            last_error = f"{response.status_code} - {response.text}"
+            response.close()
+            if response.status_code not in self.RETRY_STATUSES:
+                break
+            logger.warning(f"Ollama returned {response.status_code}, retrying")
+
+        raise ConnectionError(f"Failed to connect to Ollama: {last_error}")
+
+    def _record_usage(self, body):
+        # Final generate responses carry token counts and eval time in nanoseconds
+        prompt_tokens.inc(body.get("prompt_eval_count") or 0, model=self.model)
+        completion_tokens.inc(body.get("eval_count") or 0, model=self.model)
+        if body.get("eval_count") and body.get("eval_duration"):
+            tokens_per_second.observe(body["eval_count"] / (body["eval_duration"] / 1e9), model=self.model)
 
-        system_prompt = "You are a research paper analysis assistant. Always respond with valid JSON."
-        
-        # Make request to Ollama API
-        headers = {"Content-Type": "application/json"}
+    def generate(self, prompt, system_prompt=SYSTEM_PROMPT, options=None):
+        """Generate a completion and return the generated text"""
         payload = {
-            "model": OLLAMA_MODEL,
+            "model": self.model,
             "prompt": prompt,
             "system": system_prompt,
-            "stream": False
+            "stream": False,
+            "keep_alive": self.keep_alive
         }
-        
-        logger.debug(f"Sending request to Ollama API at {OLLAMA_BASE_URL}/api/generate")
-        response = requests.post(f"{OLLAMA_BASE_URL}/api/generate", 
-                                json=payload, 
-                                headers=headers)
-        
-        if response.status_code != 200:
-            raise ConnectionError(f"Failed to connect to Ollama: {response.status_code} - {response.text}")
-        
-        # Parse the response
+        if options:
+            payload["options"] = options
+        with timer('ollama_generate'):
+            body = self.post("/api/generate", payload).json()
+        self._record_usage(body)
+        return body.get("response", "")
+
+    def embed(self, texts, model=OLLAMA_EMBED_MODEL):
+        """Embed a batch of texts in one request and return one vector per text"""
+        payload = {
+            "model": model,
+            "input": texts,
+            "keep_alive": self.keep_alive
+        }
+        with timer('ollama_embed'):
+            body = self.post("/api/embed", payload).json()
+        prompt_tokens.inc(body.get("prompt_eval_count") or 0, model=model)
+        return body["embeddings"]
+
+    def generate_stream(self, prompt, system_prompt=SYSTEM_PROMPT, options=None):
+        """Generate a completion, yielding text fragments as Ollama produces them"""
+        payload = {
+            "model": self.model,
+            "prompt": prompt,
+            "system": system_prompt,
+            "stream": True,
+            "keep_alive": self.keep_alive
+        }
+        if options:
+            payload["options"] = options
+        started = time.perf_counter()
+        response = self.post("/api/generate", payload, stream=True)
         try:
-            result = response.json()
-            # Extract the content from the response
-            content = result.get("response", "")
-            
-            # Try to extract JSON from the content
-            # Look for JSON block between triple backticks or just try to parse the whole thing
-            json_text = content
-            if "```json" in content and "```" in content.split("```json", 1)[1]:
-                json_text = content.split("```json", 1)[1].split("```", 1)[0]
-            elif "```" in content and "```" in content.split("```", 1)[1]:
-                json_text = content.split("```", 1)[1].split("```", 1)[0]
-            
-            # Try to parse it as JSON
-            analysis = json.loads(json_text)
-            return analysis
-        except json.JSONDecodeError:
-            # If the model didn't return valid JSON, try to parse it in a more forgiving way
-            logger.warning("Failed to parse JSON response, attempting fallback parsing")
-            text_response = content
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    raise ConnectionError(f"Ollama stream error: {chunk['error']}")
+                if chunk.get("response"):
+                    yield chunk["response"]
+                if chunk.get("done"):
+                    self._record_usage(chunk)
+                    break
+        except requests.exceptions.RequestException as e:
+            raise ConnectionError(f"Ollama stream interrupted: {str(e)}")
+        finally:
+            response.close()
+            record_stage('ollama_generate', time.perf_counter() - started)
+
+class SchedulerBusy(Exception):
+    """Raised when a generation is not admitted to the Ollama queue"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class OllamaScheduler:
+    """Bounded priority scheduler for Ollama generations.
+
+    At most max_concurrency generations run at once. Waiting generations are
+    served by priority class, then first come first served. A class whose
+    queue is full, or a wait longer than queue_timeout, raises SchedulerBusy
+    with a Retry-After estimate instead of piling up more work.
+    """
+
+    def __init__(self, max_concurrency=OLLAMA_MAX_CONCURRENCY, queue_limits=None,
+                 queue_timeout=OLLAMA_QUEUE_TIMEOUT):
+        self.max_concurrency = max_concurrency
+        self.queue_limits = dict(OLLAMA_QUEUE_LIMITS if queue_limits is None else queue_limits)
+        self.queue_timeout = queue_timeout
+        self.rejected = 0
+        self._active = 0
+        self._waiting = []
+        self._queued = {priority: 0 for priority in self.queue_limits}
+        self._counter = itertools.count()
+        self._avg_service_time = 30.0
+        self._cond = threading.Condition()
+
+    def retry_after(self):
+        """Estimated seconds until a new request could start"""
+        backlog = (len(self._waiting) + self._active) / max(self.max_concurrency, 1)
+        return max(1, math.ceil(backlog * self._avg_service_time))
 
-            # Basic fallback response
+    def _busy(self, message):
+        self.rejected += 1
+        return SchedulerBusy(message, self.retry_after())
+
+    def acquire(self, priority=PRIORITY_ANALYSIS):
+        with self._cond:
+            if self._active < self.max_concurrency and not self._waiting:
+                self._active += 1
+                return
+            if self._queued.get(priority, 0) >= self.queue_limits.get(priority, 0):
+                raise self._busy("Ollama queue is full")
+
+            ticket = (priority, next(self._counter))
+            heapq.heappush(self._waiting, ticket)
+            self._queued[priority] += 1
+            deadline = time.monotonic() + self.queue_timeout
+            try:
+                while self._active >= self.max_concurrency or self._waiting[0] != ticket:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._waiting.remove(ticket)
+                        heapq.heapify(self._waiting)
+                        self._cond.notify_all()
+                        raise self._busy("Timed out waiting for an Ollama slot")
+                    self._cond.wait(remaining)
+                heapq.heappop(self._waiting)
+                self._active += 1
+            finally:
+                self._queued[priority] -= 1
+
+    def release(self, elapsed=None):
+        with self._cond:
+            self._active -= 1
+            if elapsed is not None:
+                self._avg_service_time = 0.8 * self._avg_service_time + 0.2 * elapsed
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, priority=PRIORITY_ANALYSIS):
+        """Hold one generation slot for the duration of the block"""
+        with timer('ollama_queue'):
+            self.acquire(priority)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    def stats(self):
+        with self._cond:
             return {
-                "summary": text_response[:500],  # First 500 chars as summary
-                "key_points": ["Analysis format error - please try again"],
-                "methodology": "Unable to parse methodology",
-                "findings": ["Analysis format error - please try again"],
-                "citations": []
+                'active': self._active,
+                'waiting': len(self._waiting),
+                'rejected': self.rejected,
+                'avg_service_time': self._avg_service_time
             }
 
+# Shared by every Ollama call in this process
+scheduler = OllamaScheduler()
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """Return the process-wide Ollama client"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = OllamaClient()
+    return _client
+
+def _create_llm_cache():
+    if not LLM_CACHE_ENABLED:
+        return None
+    cache = TieredCache(
+        LRUCache(max_entries=LLM_CACHE_MAX_ENTRIES),
+        SQLiteCache(CACHE_DB_PATH, namespace=f"llm:{OLLAMA_MODEL}", ttl=LLM_CACHE_TTL)
+    )
+    try:
+        # Responses of any other model are stale once OLLAMA_MODEL changes
+        cache.disk.drop_namespaces("llm:")
+        cache.disk.purge_expired()
+    except sqlite3.Error as e:
+        logger.error(f"Failed to prune LLM response cache: {str(e)}")
+    return cache
+
+# Generated text keyed on (model, system prompt, prompt, options)
+llm_cache = _create_llm_cache()
+
+def _cache_key(prompt, system_prompt, options):
+    key = json.dumps([get_client().model, system_prompt, prompt, options or {}], sort_keys=True)
+    return hashlib.sha256(key.encode()).hexdigest()
+
+def _is_cacheable(content):
+    # Don't pin a malformed response; the next call may well produce valid JSON.
+    # Not timed as parse_json: the caller parses the same response again
+    try:
+        _load_json(content)
+        return True
+    except json.JSONDecodeError:
+        return False
+
+# Concurrent identical generations share one Ollama call
+_inflight = SingleFlight()
+
+def _cached(key):
+    if llm_cache is None:
+        return None
+    content = llm_cache.get(key)
+    if content is not None:
+        logger.debug(f"LLM cache hit for {key}")
+    return content
+
+def _store(key, content):
+    if llm_cache is not None and _is_cacheable(content):
+        llm_cache.set(key, content)
+
+def _generate_uncached(key, prompt, system_prompt, options, priority):
+    # A previous leader may have filled the cache since our lookup
+    content = _cached(key)
+    if content is None:
+        with scheduler.slot(priority):
+            content = get_client().generate(prompt, system_prompt, options)
+        _store(key, content)
+    return content
+
+def embed_texts(texts, priority=PRIORITY_BATCH):
+    """Embed a batch of texts with the local embedding model"""
+    with scheduler.slot(priority):
+        return get_client().embed(texts)
+
+def generate(prompt, system_prompt=SYSTEM_PROMPT, options=None, priority=PRIORITY_ANALYSIS):
+    """Send a prompt to Ollama and return the generated text"""
+    key = _cache_key(prompt, system_prompt, options)
+    content = _cached(key)
+    if content is not None:
+        return content
+
+    while True:
+        try:
+            return _inflight.do(key, _generate_uncached, key, prompt, system_prompt, options, priority)
+        except FlightAbandoned:
+            # The streaming leader went away; take over the generation
+            continue
+
+def generate_stream(prompt, system_prompt=SYSTEM_PROMPT, options=None, priority=PRIORITY_ANALYSIS):
+    """Yield generated text fragments, serving cached responses in one piece.
+
+    When an identical generation is already running, the result of that
+    generation is yielded in one piece once it finishes.
+    """
+    key = _cache_key(prompt, system_prompt, options)
+    content = _cached(key)
+    if content is not None:
+        yield content
+        return
+
+    flight, leader = _inflight.begin(key)
+    if not leader:
+        try:
+            content = flight.wait()
+        except FlightAbandoned:
+            content = generate(prompt, system_prompt, options, priority)
+        yield content
+        return
+
+    parts = []
+    try:
+        with scheduler.slot(priority):
+            for fragment in get_client().generate_stream(prompt, system_prompt, options):
+                parts.append(fragment)
+                yield fragment
+    except GeneratorExit:
+        _inflight.finish(key, flight, error=FlightAbandoned())
+        raise
+    except BaseException as e:
+        _inflight.finish(key, flight, error=e)
+        raise
+
+    content = "".join(parts)
+    _store(key, content)
+    _inflight.finish(key, flight, result=content)
+
+def cache_stats():
+    """Hit/miss counters of the LLM response cache"""
+    return llm_cache.stats() if llm_cache is not None else {}
+
+def parse_json_response(content):
+    """Extract and parse the JSON object in a model response.
+
+    Raises json.JSONDecodeError when the response is not valid JSON.
+    """
+    with timer('parse_json'):
+        return _load_json(content)
+
+def _load_json(content):
+    # Look for JSON block between triple backticks or just try to parse the whole thing
+    json_text = content
+    if "```json" in content and "```" in content.split("```json", 1)[1]:
+        json_text = content.split("```json", 1)[1].split("```", 1)[0]
+    elif "```" in content and "```" in content.split("```", 1)[1]:
+        json_text = content.split("```", 1)[1].split("```", 1)[0]
+
+    return json.loads(json_text)
+
+def _fallback_analysis(content):
+    # Basic fallback response when the model didn't return valid JSON
+    return {
+        "summary": content[:500],  # First 500 chars as summary
+        "key_points": ["Analysis format error - please try again"],
+        "methodology": "Unable to parse methodology",
+        "findings": ["Analysis format error - please try again"],
+        "citations": []
+    }
+
+def _parse_analysis(content):
+    try:
+        return parse_json_response(content)
+    except json.JSONDecodeError:
+        logger.warning("Failed to parse JSON response, attempting fallback parsing")
+        return _fallback_analysis(content)
+
+def _analyze_single(text, is_summary, priority):
+    return _parse_analysis(generate(build_prompt(text, is_summary), priority=priority))
+
+def _as_list(value):
+    if isinstance(value, list):
+        return [str(item) for item in value if item]
+    return [str(value)] if value else []
+
+def _merge_unique(values):
+    seen = set()
+    merged = []
+    for value in values:
+        key = value.strip().lower()
+        if key and key not in seen:
+            seen.add(key)
+            merged.append(value.strip())
+    return merged
+
+def _reduce_summaries(summaries, priority):
+    if len(summaries) == 1:
+        return summaries[0]
+    prompt = """
+            The following are summaries of consecutive parts of one research document.
+            Combine them into a single brief summary of the whole document.
+
+            Respond with JSON in this format:
+            {
+                "summary": "brief summary"
+            }
+
+            Here are the part summaries:
+            """ + "\n\n".join(f"Part {i}: {s}" for i, s in enumerate(summaries, 1))
+    try:
+        return parse_json_response(generate(prompt, priority=priority)).get("summary") or " ".join(summaries)
+    except Exception as e:
+        logger.warning(f"Failed to reduce chunk summaries, joining them instead: {str(e)}")
+        return " ".join(summaries)
+
+def _analyze_chunked(chunks, priority, on_chunk_done=None):
+    """Analyze chunks concurrently (map) and merge them into one analysis (reduce)"""
+    completed = itertools.count(1)
+
+    def analyze_chunk(indexed_chunk):
+        index, chunk = indexed_chunk
+        content = generate(build_prompt(chunk, part=(index + 1, len(chunks))), priority=priority)
+        if on_chunk_done:
+            on_chunk_done(next(completed), len(chunks))
+        try:
+            return parse_json_response(content), content
+        except json.JSONDecodeError:
+            logger.warning(f"Failed to parse JSON response for chunk {index + 1}/{len(chunks)}")
+            return None, content
+
+    logger.debug(f"Analyzing document in {len(chunks)} chunks")
+    with ThreadPoolExecutor(max_workers=min(ANALYSIS_MAP_WORKERS, len(chunks))) as executor:
+        results = list(executor.map(analyze_chunk, enumerate(chunks)))
+
+    analyses = [analysis for analysis, _ in results if isinstance(analysis, dict)]
+    if not analyses:
+        return _fallback_analysis(results[0][1])
+
+    summaries = [str(a["summary"]) for a in analyses if a.get("summary")]
+    return {
+        "summary": _reduce_summaries(summaries, priority) if summaries else "",
+        "key_points": _merge_unique(p for a in analyses for p in _as_list(a.get("key_points"))),
+        "methodology": " ".join(_merge_unique(m for a in analyses for m in _as_list(a.get("methodology")))),
+        "findings": _merge_unique(f for a in analyses for f in _as_list(a.get("findings"))),
+        "citations": _merge_unique(c for a in analyses for c in _as_list(a.get("citations")))
+    }
+
+def _default_priority(is_summary, priority):
+    if priority is not None:
+        return priority
+    return PRIORITY_SUMMARY if is_summary else PRIORITY_ANALYSIS
+
+def analyze_chunks(chunks, priority=PRIORITY_ANALYSIS, on_chunk_done=None):
+    """Run a full analysis over text already split with chunk_text.
+
+    on_chunk_done(completed, total) is called as each chunk finishes.
+    """
+    if len(chunks) == 1:
+        analysis = _analyze_single(chunks[0], False, priority)
+        if on_chunk_done:
+            on_chunk_done(1, 1)
+        return analysis
+    return _analyze_chunked(chunks, priority, on_chunk_done)
+
+def analyze_document(text, is_summary=False, max_chunk_tokens=ANALYSIS_CHUNK_TOKENS, priority=None):
+    """Analyze document content using Ollama
+
+    Full analyses of documents over max_chunk_tokens are chunked and analyzed
+    with map-reduce; summaries are always a single call. Raises
+    SchedulerBusy when the Ollama queue cannot take the request.
+    """
+    priority = _default_priority(is_summary, priority)
+    try:
+        if not is_summary and estimate_tokens(text) > max_chunk_tokens:
+            chunks = chunk_text(text, max_chunk_tokens)
+            if len(chunks) > 1:
+                return _analyze_chunked(chunks, priority)
+
+        return _analyze_single(text, is_summary, priority)
+
+    except SchedulerBusy:
+        raise
+    except ConnectionError as e:
+        logger.error(f"Failed to connect to Ollama: {str(e)}")
+        raise ConnectionError(f"Failed to connect to Ollama. Make sure Ollama is running at {OLLAMA_BASE_URL}")
+    except Exception as e:
+        logger.error(f"Failed to analyze document: {str(e)}")
+        raise Exception(f"Failed to analyze document: {str(e)}")
+
+def stream_analysis(text, is_summary=False, max_chunk_tokens=ANALYSIS_CHUNK_TOKENS, priority=None):
+    """Analyze document content, yielding (event, data) pairs as output arrives.
+
+    Yields ("token", fragment) for each piece of generated text and finishes
+    with ("result", analysis). Documents that need chunking are analyzed with
+    map-reduce, so they yield a ("status", ...) event and then the result.
+    """
+    priority = _default_priority(is_summary, priority)
+    try:
+        if not is_summary and estimate_tokens(text) > max_chunk_tokens:
+            chunks = chunk_text(text, max_chunk_tokens)
+            if len(chunks) > 1:
+                yield "status", {"chunks": len(chunks)}
+                yield "result", _analyze_chunked(chunks, priority)
+                return
+
+        parts = []
+        for fragment in generate_stream(build_prompt(text, is_summary), priority=priority):
+            parts.append(fragment)
+            yield "token", fragment
+        yield "result", _parse_analysis("".join(parts))
+
+    except SchedulerBusy:
+        raise
     except ConnectionError as e:
         logger.error(f"Failed to connect to Ollama: {str(e)}")
         raise ConnectionError(f"Failed to connect to Ollama. Make sure Ollama is running at {OLLAMA_BASE_URL}")
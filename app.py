@@ -1,33 +1,87 @@
 import os
+import json
+import uuid
 import logging
-from flask import Flask, render_template, request, jsonify, flash, redirect, url_for
-from werkzeug.utils import secure_filename
+import click
+from flask import (Flask, Response, render_template, request, jsonify, flash, redirect, url_for,
+                   stream_with_context, send_file, abort)
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import DeclarativeBase
+from markupsafe import Markup
+from werkzeug.utils import secure_filename, safe_join
 from document_processor import process_document
-from ai_analyzer import analyze_document
-from core_api import CoreAPI
-from manim import *
-import tempfile
-import shutil
-import time
+from ai_analyzer import (PRIORITY_SUMMARY, SchedulerBusy, analyze_document, cache_stats, embed_texts, scheduler,
+                         stream_analysis)
+from core_api import CoreAPI, CoreRateLimited
+from upload_cache import UploadCache, save_and_hash
+from document_store import DOCUMENT_PAGE_SIZE, DocumentStore
+from paper_index import PaperIndex, merged_search, paper_key, read_core_dump
+from plagiarism import PlagiarismIndex
+from embedding_index import EmbeddingIndex, EmbeddingIndexer
+from pipeline import AnalysisPipeline, PipelineBusy
+from video_renderer import RenderQueue
+import metrics
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+class Base(DeclarativeBase):
+    pass
+
+db = SQLAlchemy(model_class=Base)
+
 # Initialize Flask app
 app = Flask(__name__)
 
+# Database configuration
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///aris.db')
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    'pool_recycle': 300,
+    'pool_pre_ping': True,
+}
+db.init_app(app)
+
+# Analysed uploads are written to the Document table in background batches
+with app.app_context():
+    from models import Document
+    db.create_all()
+    document_store = DocumentStore(app, db, Document)
+    document_store.ensure_columns()
+    document_store.ensure_indexes()
+
+# Extraction and analysis results keyed by upload content hash
+upload_cache = UploadCache(document_store)
+
 # Video generation configuration
-VIDEO_OUTPUT_DIR = os.path.join('static', 'videos')
+VIDEO_OUTPUT_DIR = os.getenv('VIDEO_OUTPUT_DIR', os.path.join('static', 'videos'))
 if not os.path.exists(VIDEO_OUTPUT_DIR):
     os.makedirs(VIDEO_OUTPUT_DIR)
 
+# Video URLs only change when the scene inputs do, so clients may cache them for long
+VIDEO_CACHE_MAX_AGE = int(os.getenv('VIDEO_CACHE_MAX_AGE', 365 * 24 * 3600))
+# Let a fronting nginx/Apache send video files itself
+app.config['USE_X_SENDFILE'] = os.getenv('USE_X_SENDFILE', 'false').lower() == 'true'
+
+# Manim renders run in separate processes off the request path
+render_queue = RenderQueue(VIDEO_OUTPUT_DIR)
+
 # Initialize CORE API client with configuration from environment variables
 core_api = CoreAPI(
     api_key=os.getenv('CORE_API_KEY'),
     api_url=os.getenv('CORE_API_URL')
 )
 
+# Every CORE result and analysed upload goes into the local full-text
+# index, the plagiarism index and, in the background, the embedding index
+paper_index = PaperIndex()
+plagiarism_index = PlagiarismIndex()
+embedding_index = EmbeddingIndex()
+embedding_indexer = EmbeddingIndexer(embedding_index, embed_texts)
+for index in (paper_index, plagiarism_index, embedding_indexer):
+    core_api.add_listener(index.add_papers)
+    upload_cache.add_listener(index.add_document)
+
 # File upload configuration
 UPLOAD_FOLDER = '/tmp/uploads'
 ALLOWED_EXTENSIONS = {'pdf', 'docx', 'txt'}
@@ -38,9 +92,114 @@ if not os.path.exists(UPLOAD_FOLDER):
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
+# Admin endpoints require this token in X-Admin-Token when it is set
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+
+# Per-stage Server-Timing headers; always on in debug mode
+SERVER_TIMING = os.getenv('SERVER_TIMING', 'false').lower() == 'true'
+
+# Background extract -> chunk -> analyze -> persist pipeline for uploads
+pipeline = AnalysisPipeline(app, upload_cache)
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+@app.template_filter('nl2br')
+def nl2br(value):
+    """Render newlines in plain text as <br> tags"""
+    return Markup('<br>\n').join((value or '').split('\n'))
+
+def structured_summary(analysis):
+    """The list-valued sections of an analysis, as shown and animated"""
+    def as_list(value):
+        if isinstance(value, list):
+            return value
+        return [value] if value else []
+
+    return {
+        'key_points': as_list(analysis.get('key_points')),
+        'methodology': as_list(analysis.get('methodology')),
+        'findings': as_list(analysis.get('findings')),
+        'conclusions': as_list(analysis.get('conclusions'))
+    }
+
+def analysis_context(analysis, filename):
+    """Template variables for analysis.html from a document analysis"""
+    return {
+        'analysis': analysis,
+        'filename': filename,
+        'title': filename,
+        'summary': analysis.get('summary', ''),
+        'structured_summary': structured_summary(analysis)
+    }
+
+def render_video_url(job):
+    """URL of the best video a render job has produced so far, or None"""
+    if not job.get('video_filename'):
+        return None
+    return url_for('serve_video', filename=job['video_filename'])
+
+def build_paper_prompt(title, abstract):
+    """Create a structured summary prompt for a paper's title and abstract"""
+    return f"""Please analyze this research paper and provide a structured summary.
+Title: {title}
+
+Abstract: {abstract}
+
+Please provide a detailed analysis in the following format:
+
+1. Key Points:
+- List the main points and contributions
+- Highlight innovative aspects
+
+2. Methodology:
+- Research methods used
+- Experimental setup
+- Data collection approach
+
+3. Findings:
+- Main results
+- Statistical significance
+- Key discoveries
+
+4. Conclusions:
+- Main takeaways
+- Implications
+- Future work suggestions
+
+Please be concise but comprehensive in your analysis."""
+
+def sse_event(event, data):
+    """Format one Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def event_stream(events, cleanup=None):
+    """Stream (event, data) pairs from an analysis generator as SSE"""
+    def generate():
+        # Send a comment immediately so proxies and browsers see the first byte
+        yield ': stream open\n\n'
+        try:
+            for event, data in events:
+                yield sse_event(event, data)
+        except SchedulerBusy as e:
+            logger.warning(f"Analysis rejected: {str(e)}")
+            yield sse_event('error', {'error': 'Analysis service is busy. Please try again shortly.',
+                                      'retry_after': e.retry_after})
+        except ConnectionError as e:
+            logger.error(f"Failed to connect to Ollama: {str(e)}")
+            yield sse_event('error', {'error': 'Unable to connect to Ollama service. Make sure Ollama is running.'})
+        except Exception as e:
+            logger.error(f"Streaming analysis error: {str(e)}")
+            yield sse_event('error', {'error': 'Error analyzing document'})
+
+    response = Response(stream_with_context(generate()),
+                        mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    if cleanup:
+        # Runs even if the client disconnects before the generator starts
+        response.call_on_close(cleanup)
+    return response
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -49,14 +208,18 @@ def index():
 def search_papers():
     """Main search endpoint that handles both HTML and JSON responses"""
     query = request.args.get('q', '')
-    page = int(request.args.get('page', 1))
+    page = max(1, request.args.get('page', 1, type=int))
+    # Pages of one search share the snapshot its first page took of the index
+    snapshot = request.args.get('snapshot', type=int)
 
     if request.args.get('format') == 'json':
         try:
-            search_results = core_api.search_papers(query, page_size=5)
+            search_results = merged_search(paper_index, core_api, query, page_size=5)
             if search_results:
                 return jsonify(search_results)
             return jsonify({'error': 'No results found'}), 404
+        except CoreRateLimited:
+            raise
         except ValueError as e:
             logger.error(f"API configuration error: {str(e)}")
             return jsonify({'error': 'API configuration error. Please check API key.'}), 500
@@ -68,18 +231,23 @@ def search_papers():
         return redirect(url_for('index'))
 
     try:
-        search_results = core_api.search_papers(query, page=page)
+        # Fetch the next page while the user reads this one
+        search_results = merged_search(paper_index, core_api, query, page=page, prefetch=True,
+                                       snapshot=snapshot)
         if search_results:
             return render_template('search_results.html',
                                query=query,
                                results=search_results['results'],
                                total_hits=search_results['total_hits'],
                                page=search_results['page'],
-                               page_size=search_results['page_size'])
+                               page_size=search_results['page_size'],
+                               snapshot=search_results['snapshot'])
         else:
             flash('Error searching papers. Please verify API configuration.', 'error')
             return redirect(url_for('index'))
 
+    except CoreRateLimited:
+        raise
     except ValueError as e:
         logger.error(f"API configuration error: {str(e)}")
         flash('API configuration error. Please check API key.', 'error')
@@ -91,56 +259,146 @@ def search_papers():
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
+    """Queue an uploaded document for analysis and return its job"""
+    wants_json = request.accept_mimetypes.best == 'application/json'
     if 'file' not in request.files:
+        if wants_json:
+            return jsonify({'error': 'No file part'}), 400
         flash('No file part', 'error')
         return redirect(url_for('index'))
 
     file = request.files['file']
     if file.filename == '':
+        if wants_json:
+            return jsonify({'error': 'No selected file'}), 400
         flash('No selected file', 'error')
         return redirect(url_for('index'))
 
     if file and allowed_file(file.filename):
         try:
             filename = secure_filename(file.filename)
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
-
-            # Process document
-            text_content = process_document(filepath)
-
-            try:
-                # Analyze document with error handling
-                analysis_result = analyze_document(text_content)
-            except ConnectionError as e:
-                logger.error(f"Failed to connect to Ollama: {str(e)}")
-                flash('Unable to connect to Ollama service. Make sure Ollama is running.', 'error')
-                return redirect(url_for('index'))
-            except ValueError as e:
-                logger.error(f"API configuration error: {str(e)}")
-                flash('Ollama configuration error. Please check your settings.', 'error')
-                return redirect(url_for('index'))
-            except Exception as e:
-                logger.error(f"AI analysis error: {str(e)}")
-                flash('Error analyzing document', 'error')
-                return redirect(url_for('index'))
-            finally:
-                # Cleanup file
-                if os.path.exists(filepath):
-                    os.remove(filepath)
-
-            return render_template('analysis.html', 
-                                   analysis=analysis_result,
-                                   filename=filename)
-
+            # Jobs outlive the request, so concurrent uploads need distinct paths
+            filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{uuid.uuid4().hex}_{filename}")
+            content_hash = save_and_hash(file, filepath)
+            job = pipeline.submit(filepath, filename, content_hash)
+
+        except PipelineBusy as e:
+            logger.warning(f"Upload rejected: {str(e)}")
+            return busy_response(str(e), e.retry_after)
         except Exception as e:
             logger.error(f"Error processing file: {str(e)}")
+            if wants_json:
+                return jsonify({'error': 'Error processing file'}), 500
             flash('Error processing file', 'error')
             return redirect(url_for('index'))
 
+        if wants_json:
+            return jsonify({
+                'job_id': job['id'],
+                'status': job['status'],
+                'status_url': url_for('job_status', job_id=job['id']),
+                'result_url': url_for('job_result', job_id=job['id'])
+            }), 202
+        return redirect(url_for('job_result', job_id=job['id']))
+
+    if wants_json:
+        return jsonify({'error': 'Invalid file type'}), 400
     flash('Invalid file type', 'error')
     return redirect(url_for('index'))
 
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Progress of an upload analysis job"""
+    job = pipeline.jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    status = {key: job.get(key) for key in ('id', 'filename', 'status', 'stage', 'progress', 'chunks', 'error')}
+    if job['status'] == 'done':
+        status['result_url'] = url_for('job_result', job_id=job_id)
+    return jsonify(status)
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    """Analysis page for a job, or a progress page while it is still running"""
+    job = pipeline.jobs.get(job_id)
+    wants_json = request.accept_mimetypes.best == 'application/json'
+    if job is None:
+        if wants_json:
+            return jsonify({'error': 'Job not found'}), 404
+        flash('Analysis not found', 'error')
+        return redirect(url_for('index'))
+
+    if job['status'] == 'failed':
+        if wants_json:
+            return jsonify({'error': 'Error analyzing document'}), 500
+        flash('Error analyzing document', 'error')
+        return redirect(url_for('index'))
+
+    if job['status'] != 'done':
+        if wants_json:
+            return jsonify({'status': job['status'], 'progress': job['progress']}), 202
+        return render_template('job_status.html', job=job)
+
+    if wants_json:
+        return jsonify(job['result'])
+    return render_template('analysis.html', **analysis_context(job['result'], job['filename']))
+
+@app.route('/upload/stream', methods=['POST'])
+def upload_file_stream():
+    """Analyze an uploaded document, streaming the model output as SSE"""
+    file = request.files.get('file')
+    if not file or file.filename == '':
+        return jsonify({'error': 'No file provided'}), 400
+    if not allowed_file(file.filename):
+        return jsonify({'error': 'Invalid file type'}), 400
+
+    filename = secure_filename(file.filename)
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{uuid.uuid4().hex}_{filename}")
+    content_hash = save_and_hash(file, filepath)
+
+    def cleanup():
+        if os.path.exists(filepath):
+            os.remove(filepath)
+
+    def events():
+        cached = upload_cache.get(content_hash)
+        if cached is not None:
+            yield 'result', cached['analysis']
+            return
+
+        try:
+            text_content = process_document(filepath)
+        except Exception as e:
+            logger.error(f"Error processing document: {str(e)}")
+            yield 'error', {'error': 'Error processing document. Please check the file and try again.'}
+            return
+        finally:
+            cleanup()
+        for event, data in stream_analysis(text_content):
+            if event == 'result':
+                upload_cache.put(content_hash, filename, text_content, data)
+            yield event, data
+
+    return event_stream(events(), cleanup=cleanup)
+
+@app.route('/documents', methods=['GET'])
+def list_documents():
+    """Analysed uploads, newest first; pass next_cursor back as cursor for the next page"""
+    limit = request.args.get('limit', DOCUMENT_PAGE_SIZE, type=int)
+    try:
+        documents, next_cursor = document_store.page(limit, request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'documents': documents, 'next_cursor': next_cursor})
+
+@app.route('/documents/<int:document_id>', methods=['GET'])
+def get_document(document_id):
+    document = document_store.get(document_id)
+    if document is None:
+        return jsonify({'error': 'Document not found'}), 404
+    return jsonify(document)
+
 @app.route('/notebook')
 def notebook():
     return render_template('notebook.html')
@@ -170,18 +428,38 @@ def check_plagiarism():
         if not content:
             return jsonify({'error': 'No content provided'}), 400
 
-        # TODO: Implement actual plagiarism checking
-        # For now, return placeholder data
+        similarity, matches = plagiarism_index.check(content)
         return jsonify({
-            'similarity': 15,
-            'matches': [
-                {'source': 'Sample source 1', 'similarity': 10},
-                {'source': 'Sample source 2', 'similarity': 5}
-            ]
+            'similarity': similarity,
+            'matches': matches
         })
     except Exception as e:
         logger.error(f"Plagiarism check error: {str(e)}")
         return jsonify({'error': 'Failed to check plagiarism'}), 500
+
+@app.route('/related-papers', methods=['GET'])
+def related_papers():
+    """Papers closest in embedding space to an indexed paper (key or doi) or to free text"""
+    key = request.args.get('key')
+    if request.args.get('doi'):
+        key = paper_key({'doi': request.args['doi']})
+    text = request.args.get('text')
+    k = min(max(request.args.get('k', 10, type=int), 1), 100)
+
+    vector = embedding_index.vector(key) if key else None
+    if vector is None:
+        if not text:
+            return jsonify({'error': 'Paper not indexed; provide text to embed'}), 404
+        try:
+            vector = embed_texts([text], PRIORITY_SUMMARY)[0]
+        except SchedulerBusy:
+            raise
+        except Exception as e:
+            logger.error(f"Embedding error: {str(e)}")
+            return jsonify({'error': 'Failed to embed text'}), 500
+
+    results = embedding_index.search(vector, k, exclude={key} if key else ())
+    return jsonify({'results': results})
         
 @app.route('/summarize-paper', methods=['POST'])
 def summarize_paper():
@@ -195,226 +473,63 @@ def summarize_paper():
             
         try:
             # Create a structured prompt for the Mistral model
-            prompt = f"""Please analyze this research paper and provide a structured summary.
-Title: {title}
-
-Abstract: {abstract}
-
-Please provide a detailed analysis in the following format:
-
-1. Key Points:
-- List the main points and contributions
-- Highlight innovative aspects
-
-2. Methodology:
-- Research methods used
-- Experimental setup
-- Data collection approach
-
-3. Findings:
-- Main results
-- Statistical significance
-- Key discoveries
-
-4. Conclusions:
-- Main takeaways
-- Implications
-- Future work suggestions
-
-Please be concise but comprehensive in your analysis."""
+            prompt = build_paper_prompt(title, abstract)
 
             logger.debug(f"Sending text to Ollama for summarization. Length: {len(prompt)}")
             
             # Get summary from Ollama's Mistral model
             summary_result = analyze_document(prompt, is_summary=True)
             
-            # Parse the structured response
-            sections = {
-                'key_points': [],
-                'methodology': [],
-                'findings': [],
-                'conclusions': []
-            }
-            
-            current_section = None
-            for line in summary_result.get('response', '').split('\n'):
-                line = line.strip()
-                if not line:
-                    continue
-                
-                # Check for section headers
-                lower_line = line.lower()
-                if 'key points' in lower_line:
-                    current_section = 'key_points'
-                    continue
-                elif 'methodology' in lower_line:
-                    current_section = 'methodology'
-                    continue
-                elif 'findings' in lower_line:
-                    current_section = 'findings'
-                    continue
-                elif 'conclusions' in lower_line:
-                    current_section = 'conclusions'
-                    continue
-                
-                # Add points to appropriate section
-                if current_section and line.startswith('-'):
-                    point = line[1:].strip()  # Remove the bullet point
-                    if point:
-                        sections[current_section].append(point)
-            
-            # Generate video from structured summary
+            summary = summary_result.get('summary', '')
+            sections = structured_summary(summary_result)
+
+            # Queue the video render; the page polls the job for the video
             try:
-                with tempfile.TemporaryDirectory() as temp_dir:
-                    class EnhancedSummaryScene(Scene):
-                        def construct(self):
-                            # Display title with animation
-                            title_text = Text(title, font_size=36, color=BLUE)
-                            title_text.to_edge(UP)
-                            self.play(Write(title_text))
-                            self.wait(2)
-                            
-                            # Animate title to smaller size and move to top
-                            small_title = Text(title, font_size=24, color=BLUE)
-                            small_title.to_edge(UP)
-                            self.play(Transform(title_text, small_title))
-                            
-                            # Initialize section displays
-                            current_section_title = None
-                            current_points = None
-                            
-                            # Display sections with improved animations
-                            sections_data = [
-                                ("Key Points", sections['key_points'], RED),
-                                ("Methodology", sections['methodology'], GREEN),
-                                ("Findings", sections['findings'], YELLOW),
-                                ("Conclusions", sections['conclusions'], PURPLE)
-                            ]
-                            
-                            for section_title, points, color in sections_data:
-                                if points:
-                                    # Clear previous section with fade
-                                    if current_section_title:
-                                        self.play(
-                                            FadeOut(current_section_title),
-                                            *[FadeOut(point) for point in current_points]
-                                        )
-                                    
-                                    # Display section title with animation
-                                    current_section_title = Text(
-                                        section_title,
-                                        font_size=28,
-                                        color=color
-                                    ).next_to(small_title, DOWN, buff=0.5)
-                                    
-                                    self.play(
-                                        Write(current_section_title),
-                                        run_time=1
-                                    )
-                                    
-                                    # Display points with enhanced animations
-                                    current_points = VGroup()
-                                    for i, point in enumerate(points):
-                                        # Create bullet point
-                                        bullet = Text("•", font_size=24).shift(DOWN * (i + 2) * 0.7)
-                                        
-                                        # Format point text with word wrap
-                                        words = point.split()
-                                        lines = []
-                                        current_line = []
-                                        
-                                        for word in words:
-                                            current_line.append(word)
-                                            if len(' '.join(current_line)) > 60:
-                                                lines.append(' '.join(current_line[:-1]))
-                                                current_line = [word]
-                                        
-                                        if current_line:
-                                            lines.append(' '.join(current_line))
-                                        
-                                        # Create text for each line
-                                        point_text = VGroup()
-                                        for j, line in enumerate(lines):
-                                            line_text = Text(
-                                                line,
-                                                font_size=20
-                                            ).next_to(bullet, RIGHT, buff=0.2).shift(DOWN * j * 0.4)
-                                            point_text.add(line_text)
-                                        
-                                        point_group = VGroup(bullet, point_text)
-                                        current_points.add(point_group)
-                                    
-                                    # Animate points appearing one by one
-                                    for point in current_points:
-                                        self.play(
-                                            Write(point),
-                                            run_time=1
-                                        )
-                                    self.wait(3)
-                            
-                            # Final animation
-                            if current_section_title:
-                                self.play(
-                                    FadeOut(current_section_title),
-                                    *[FadeOut(point) for point in current_points]
-                                )
-                            
-                            # Conclusion animation with particles
-                            conclusion = Text("Summary Complete", font_size=36, color=BLUE)
-                            self.play(
-                                Write(conclusion),
-                                run_time=1.5
-                            )
-                            self.wait(2)
-                            self.play(FadeOut(conclusion))
-
-                    # Configure Manim
-                    config.media_dir = temp_dir
-                    config.video_dir = temp_dir
-                    config.output_file = "summary_visualization"
-
-                    # Render the scene
-                    scene = EnhancedSummaryScene()
-                    scene.render()
-
-                    # Move the output video to static directory
-                    output_path = os.path.join(temp_dir, 'videos', 'EnhancedSummaryScene.mp4')
-                    if os.path.exists(output_path):
-                        video_filename = f'summary_viz_{int(time.time())}.mp4'
-                        target_path = os.path.join(VIDEO_OUTPUT_DIR, video_filename)
-                        shutil.copy2(output_path, target_path)
-                        
-                        # Check if the request wants JSON response
-                        if request.headers.get('Accept') == 'application/json':
-                            return jsonify({
-                                'success': True,
-                                'summary': summary_result.get('response', ''),
-                                'structured_summary': sections,
-                                'video_url': url_for('static', filename=f'videos/{video_filename}')
-                            })
-                        
-                        # Otherwise render the template
-                        return render_template('analysis.html',
-                                            title=title,
-                                            summary=summary_result.get('response', ''),
-                                            structured_summary=sections,
-                                            video_url=url_for('static', filename=f'videos/{video_filename}'))
-                    
+                render_job = render_queue.submit_progressive('summary', {'paper_title': title, 'sections': sections})
+                render_job = render_queue.status(render_job['id'])
             except Exception as video_error:
                 logger.error(f"Video generation error: {str(video_error)}")
                 if request.headers.get('Accept') == 'application/json':
                     return jsonify({
                         'success': True,
-                        'summary': summary_result.get('response', ''),
+                        'summary': summary,
                         'structured_summary': sections,
                         'video_error': str(video_error)
                     })
                 flash('Error generating video visualization', 'error')
                 return render_template('analysis.html',
                                     title=title,
-                                    summary=summary_result.get('response', ''),
+                                    summary=summary,
                                     structured_summary=sections)
+
+            video_status_url = url_for('render_job_status', job_id=render_job['id'])
+            video_url = render_video_url(render_job)
+            video_pending = render_job['status'] not in ('done', 'failed', 'cancelled')
+
+            # Check if the request wants JSON response
+            if request.headers.get('Accept') == 'application/json':
+                return jsonify({
+                    'success': True,
+                    'summary': summary,
+                    'structured_summary': sections,
+                    'video_job_id': render_job['id'],
+                    'video_status_url': video_status_url,
+                    'video_url': video_url,
+                    'video_quality': render_job.get('quality'),
+                    'video_pending': video_pending
+                })
+
+            # Otherwise render the template
+            return render_template('analysis.html',
+                                title=title,
+                                summary=summary,
+                                structured_summary=sections,
+                                video_status_url=video_status_url,
+                                video_url=video_url,
+                                video_pending=video_pending)
             
+        except SchedulerBusy:
+            raise
         except ConnectionError as e:
             logger.error(f"Failed to connect to Ollama: {str(e)}")
             return jsonify({'error': 'Unable to connect to Ollama service. Make sure Ollama is running.'}), 500
@@ -422,10 +537,24 @@ Please be concise but comprehensive in your analysis."""
             logger.error(f"AI analysis error: {str(e)}")
             return jsonify({'error': f'Error analyzing paper: {str(e)}'}), 500
             
+    except SchedulerBusy:
+        raise
     except Exception as e:
         logger.error(f"Paper summarization error: {str(e)}")
         return jsonify({'error': 'Failed to summarize paper'}), 500
 
+@app.route('/summarize-paper/stream', methods=['POST'])
+def summarize_paper_stream():
+    """Summarize a paper, streaming the model output as SSE"""
+    data = request.get_json(silent=True) or {}
+    title = data.get('title')
+    abstract = data.get('abstract')
+
+    if not title or not abstract:
+        return jsonify({'error': 'Title and abstract are required'}), 400
+
+    return event_stream(stream_analysis(build_paper_prompt(title, abstract), is_summary=True))
+
 @app.route('/generate-video', methods=['POST'])
 def generate_video():
     try:
@@ -436,51 +565,194 @@ def generate_video():
         if not paper_content and not equations:
             return jsonify({'error': 'No content or equations provided'}), 400
 
-        # Create a temporary directory for Manim output
-        with tempfile.TemporaryDirectory() as temp_dir:
-            # Create Manim scene class dynamically
-            class MathScene(Scene):
-                def construct(self):
-                    # Title
-                    title = Text("Mathematical Visualization", font_size=40)
-                    self.play(Write(title))
-                    self.wait(1)
-                    self.play(FadeOut(title))
-
-                    # Display equations one by one
-                    for eq in equations:
-                        math_eq = MathTex(eq, font_size=36)
-                        self.play(Write(math_eq))
-                        self.wait(2)
-                        self.play(FadeOut(math_eq))
-
-            # Configure Manim
-            config.media_dir = temp_dir
-            config.video_dir = temp_dir
-            config.output_file = "math_visualization"
-
-            # Render the scene
-            scene = MathScene()
-            scene.render()
-
-            # Move the output video to static directory
-            output_path = os.path.join(temp_dir, 'videos', 'MathScene.mp4')
-            if os.path.exists(output_path):
-                video_filename = f'math_viz_{int(time.time())}.mp4'
-                target_path = os.path.join(VIDEO_OUTPUT_DIR, video_filename)
-                shutil.copy2(output_path, target_path)
-                
-                return jsonify({
-                    'success': True,
-                    'video_url': url_for('static', filename=f'videos/{video_filename}')
-                })
-            else:
-                return jsonify({'error': 'Failed to generate video'}), 500
+        render_job = render_queue.submit_progressive('math', {'equations': equations})
+        render_job = render_queue.status(render_job['id'])
+        return jsonify({
+            'success': True,
+            'job_id': render_job['id'],
+            'status': render_job['status'],
+            'status_url': url_for('render_job_status', job_id=render_job['id']),
+            'video_url': render_video_url(render_job),
+            'video_quality': render_job.get('quality')
+        }), 200 if render_job['status'] == 'done' else 202
 
     except Exception as e:
         logger.error(f"Video generation error: {str(e)}")
         return jsonify({'error': f'Failed to generate video: {str(e)}'}), 500
 
+@app.route('/videos/<path:filename>', methods=['GET'])
+def serve_video(filename):
+    """Stream a rendered video with byte-range support and a content-hash ETag"""
+    key, entry = render_queue.cache.lookup_file(filename)
+    path = safe_join(os.path.abspath(VIDEO_OUTPUT_DIR), filename)
+    if entry is None or path is None or not os.path.isfile(path):
+        abort(404)
+
+    render_queue.cache.pin(key, entry)
+    # conditional=True answers Range and If-None-Match/If-Range requests;
+    # full responses go through the server's file wrapper (sendfile)
+    response = send_file(path, mimetype='video/mp4', conditional=True,
+                         etag=render_queue.cache.etag(key, entry), max_age=VIDEO_CACHE_MAX_AGE)
+    response.cache_control.public = True
+    return response
+
+@app.route('/render-jobs/<job_id>', methods=['GET'])
+def render_job_status(job_id):
+    """Status of a video render, with the video URL once it is done"""
+    job = render_queue.status(job_id)
+    if job is None:
+        return jsonify({'error': 'Render job not found'}), 404
+
+    status = {key: job.get(key) for key in ('id', 'kind', 'quality', 'status', 'error')}
+    status['video_url'] = render_video_url(job)
+    return jsonify(status)
+
+@app.route('/render-jobs/<job_id>', methods=['DELETE'])
+def cancel_render_job(job_id):
+    """Cancel a queued or running video render"""
+    if not render_queue.cancel(job_id):
+        return jsonify({'error': 'Render job not found or already finished'}), 404
+    return jsonify({'success': True, 'status': 'cancelling'}), 202
+
+@app.cli.command('ingest-core')
+@click.argument('path')
+@click.option('--embed', is_flag=True, help='Also embed the abstracts (slow, needs the embedding model)')
+def ingest_core(path, embed):
+    """Bulk-load a CORE data dump (JSON lines, optionally gzipped) into the paper indexes"""
+    count = 0
+    for batch in read_core_dump(path):
+        count += paper_index.add_papers(batch)
+        plagiarism_index.add_papers(batch)
+        if embed:
+            embedding_indexer.index_now(embedding_indexer.paper_items(batch))
+    click.echo(f"Indexed {count} papers from {path}")
+
+@app.cli.command('index-documents')
+def index_documents():
+    """Add every analysed upload to the paper indexes"""
+    count = 0
+    for document in Document.query.filter(Document.analysis.isnot(None)).yield_per(100):
+        content_hash = document.content_hash or f'document:{document.id}'
+        for index in (paper_index, plagiarism_index):
+            index.add_document(content_hash, document.filename, document.content or '', document.analysis)
+        embedding_indexer.index_now(embedding_indexer.document_items(content_hash, document.filename,
+                                                                     document.analysis))
+        count += 1
+    click.echo(f"Indexed {count} documents")
+
+@app.cli.command('train-embeddings')
+@click.option('--cells', type=int, help='Number of IVF cells (default: square root of the index size)')
+def train_embeddings(cells):
+    """Cluster the embedding index for IVF search"""
+    trained = embedding_index.train_ivf(cells)
+    click.echo(f"Trained {trained} cells over {len(embedding_index)} embeddings")
+
+def admin_authorized():
+    # Prometheus can only send the token as a bearer token
+    return not ADMIN_TOKEN or ADMIN_TOKEN in (request.headers.get('X-Admin-Token'),
+                                             request.headers.get('Authorization', '').removeprefix('Bearer '))
+
+http_request_seconds = metrics.registry.histogram(
+    'http_request_seconds', 'HTTP request latency until the response starts', ('method', 'endpoint', 'status'))
+
+@app.before_request
+def start_request_timer():
+    metrics.begin_request()
+
+@app.after_request
+def record_request_timing(response):
+    total, timings = metrics.end_request()
+    if total is None:
+        return response
+    http_request_seconds.observe(total, method=request.method, endpoint=request.endpoint or 'unknown',
+                                 status=response.status_code)
+    if app.debug or SERVER_TIMING:
+        response.headers['Server-Timing'] = metrics.server_timing(total, timings)
+    return response
+
+def collect_app_metrics():
+    """Cache, queue and index statistics kept by the app's components"""
+    renders = render_queue.stats()
+    caches = {
+        'llm': cache_stats(),
+        'core_search': core_api.cache.stats(),
+        'upload': upload_cache.memory.stats(),
+        'video': renders['videos'],
+        'glyph': renders['glyphs']
+    }
+    yield ('cache_hits_total', 'counter', 'Cache hits by cache',
+           [({'cache': name}, stats.get('hits')) for name, stats in caches.items()])
+    yield ('cache_misses_total', 'counter', 'Cache misses by cache',
+           [({'cache': name}, stats.get('misses')) for name, stats in caches.items()])
+
+    ollama = scheduler.stats()
+    yield 'ollama_active', 'gauge', 'Ollama generations running', [({}, ollama['active'])]
+    yield 'ollama_waiting', 'gauge', 'Ollama generations queued for a slot', [({}, ollama['waiting'])]
+    yield 'ollama_rejected_total', 'counter', 'Ollama calls refused as busy', [({}, ollama['rejected'])]
+
+    yield 'video_storage_bytes', 'gauge', 'Disk used by rendered videos', [({}, renders['videos']['bytes'])]
+    yield 'video_evictions_total', 'counter', 'Videos evicted from storage', [({}, renders['videos']['evictions'])]
+    yield 'render_queue_length', 'gauge', 'Render jobs waiting for a worker', [({}, renders['queued'])]
+
+    yield 'document_writes_pending', 'gauge', 'Analyses waiting for the next batch write', \
+        [({}, document_store.stats()['pending'])]
+    yield ('indexed_papers', 'gauge', 'Papers in the local indexes by index and source',
+           [({'index': 'papers', 'source': source}, count) for source, count in paper_index.stats().items()] +
+           [({'index': 'plagiarism', 'source': 'all'}, plagiarism_index.stats()['documents']),
+            ({'index': 'embeddings', 'source': 'all'}, len(embedding_index))])
+
+metrics.registry.add_collector(collect_app_metrics)
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Metrics of this worker process in the Prometheus text format"""
+    if not admin_authorized():
+        return jsonify({'error': 'Forbidden'}), 403
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/admin/videos', methods=['GET'])
+def video_storage_stats():
+    """Disk usage of rendered videos and the glyph cache"""
+    if not admin_authorized():
+        return jsonify({'error': 'Forbidden'}), 403
+    return jsonify(render_queue.stats())
+
+@app.route('/admin/videos/evict', methods=['POST'])
+def evict_videos():
+    """Evict unpinned videos down to the byte budget, or to max_bytes if given"""
+    if not admin_authorized():
+        return jsonify({'error': 'Forbidden'}), 403
+    data = request.get_json(silent=True) or {}
+    evicted = render_queue.cache.evict(data.get('max_bytes'))
+    return jsonify({
+        'evicted': [entry['filename'] for entry in evicted],
+        'bytes': sum(entry['size'] for entry in evicted),
+        'usage': render_queue.cache.usage()
+    })
+
+def busy_response(message, retry_after):
+    """503 with Retry-After, as JSON for API clients or a flashed message otherwise"""
+    if (request.is_json or request.args.get('format') == 'json' or
+            request.accept_mimetypes.best == 'application/json'):
+        response = jsonify({'error': message, 'retry_after': retry_after})
+    else:
+        flash(message, 'error')
+        response = app.make_response(render_template('index.html'))
+    response.status_code = 503
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+@app.errorhandler(SchedulerBusy)
+def scheduler_busy(e):
+    logger.warning(f"Analysis rejected: {str(e)}")
+    return busy_response('Analysis service is busy. Please try again shortly.', e.retry_after)
+
+@app.errorhandler(CoreRateLimited)
+def core_rate_limited(e):
+    logger.warning(f"Search rejected: {str(e)}")
+    return busy_response(f'Paper search is rate limited. Please try again in {e.retry_after} seconds.',
+                         e.retry_after)
+
 @app.errorhandler(413)
 def too_large(e):
     flash('File is too large (max 16MB)', 'error')
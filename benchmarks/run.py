@@ -0,0 +1,260 @@
+"""Load-test the app against local Ollama and CORE stubs.
+
+    python -m benchmarks.run --duration 30 --concurrency 8 --output bench.json
+    python -m benchmarks.run --baseline bench.json   # exit 1 on a regression
+
+Unless --url is given, the app is started in this process on a threaded
+WSGI server with its databases and caches in a temporary directory. Each
+endpoint is loaded in turn by --concurrency clients for --duration seconds.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import threading
+import subprocess
+from datetime import datetime, timezone
+import numpy as np
+import requests
+from benchmarks import stubs
+
+TOPICS = ['neural networks', 'protein folding', 'graph theory', 'climate models', 'quantum error correction',
+          'reinforcement learning', 'gene expression', 'dark matter', 'federated learning', 'soil microbiome']
+
+DEFAULT_ENDPOINTS = ['search', 'summarize', 'summarize_stream', 'plagiarism', 'related', 'upload']
+
+# Regression tolerance against a baseline, as a share of the baseline value
+DEFAULT_TOLERANCE = 0.2
+
+def _topic(i, distinct):
+    n = i % distinct
+    return f'{TOPICS[n % len(TOPICS)]} {n // len(TOPICS)}'
+
+def _abstract(i, distinct):
+    topic = _topic(i, distinct)
+    return f'This paper examines {topic}. ' + ' '.join(f'We report result {k} on {topic}.' for k in range(20))
+
+def search(session, url, i, distinct):
+    return session.get(f'{url}/search', params={'q': _topic(i, distinct), 'format': 'json'})
+
+def summarize(session, url, i, distinct):
+    return session.post(f'{url}/summarize-paper',
+                        json={'title': _topic(i, distinct).title(), 'abstract': _abstract(i, distinct)})
+
+def summarize_stream(session, url, i, distinct):
+    response = session.post(f'{url}/summarize-paper/stream', stream=True,
+                            json={'title': _topic(i, distinct).title(), 'abstract': _abstract(i, distinct)})
+    body = b''.join(response.iter_content(None))
+    if response.ok and b'event: result' not in body:
+        response.status_code = 599
+    return response
+
+def plagiarism(session, url, i, distinct):
+    return session.post(f'{url}/check-plagiarism', json={'content': _abstract(i, distinct)})
+
+def related(session, url, i, distinct):
+    return session.get(f'{url}/related-papers', params={'text': _abstract(i, distinct), 'k': 10})
+
+def upload(session, url, i, distinct, poll_interval=0.05, timeout=300):
+    """Upload a text file and poll its analysis job to completion"""
+    response = session.post(f'{url}/upload', headers={'Accept': 'application/json'},
+                            files={'file': (f'paper-{i % distinct}.txt', _abstract(i, distinct) * 5)})
+    if response.status_code != 202:
+        return response
+    status_url = url + response.json()['status_url']
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        response = session.get(status_url)
+        state = response.json().get('status') if response.ok else None
+        if state == 'done':
+            return response
+        if state == 'failed' or not response.ok:
+            response.status_code = response.status_code if not response.ok else 599
+            return response
+        time.sleep(poll_interval)
+    response.status_code = 598
+    return response
+
+ENDPOINTS = {fn.__name__: fn for fn in (search, summarize, summarize_stream, plagiarism, related, upload)}
+
+def run_endpoint(name, url, concurrency, duration, distinct):
+    """Closed-loop load: each client sends its next request when the last one finishes"""
+    fn = ENDPOINTS[name]
+    latencies = []
+    statuses = {}
+    counter = iter(range(sys.maxsize))
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client():
+        session = requests.Session()
+        while time.monotonic() < deadline:
+            with lock:
+                i = next(counter)
+            started = time.perf_counter()
+            try:
+                status = fn(session, url, i, distinct).status_code
+            except requests.RequestException:
+                status = 'error'
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    latencies_ms = np.array(latencies) * 1000
+    ok = sum(count for status, count in statuses.items() if status.isdigit() and int(status) < 400)
+    return {
+        'requests': len(latencies),
+        'errors': len(latencies) - ok,
+        'statuses': statuses,
+        'rps': round(len(latencies) / wall, 2),
+        'latency_ms': {
+            'p50': round(float(np.percentile(latencies_ms, 50)), 1),
+            'p95': round(float(np.percentile(latencies_ms, 95)), 1),
+            'p99': round(float(np.percentile(latencies_ms, 99)), 1),
+            'mean': round(float(latencies_ms.mean()), 1),
+            'max': round(float(latencies_ms.max()), 1)
+        } if len(latencies) else None
+    }
+
+def scrape_stages(url, admin_token=None):
+    """Mean duration and count per stage from the app's /metrics"""
+    headers = {'X-Admin-Token': admin_token} if admin_token else {}
+    try:
+        response = requests.get(f'{url}/metrics', headers=headers, timeout=10)
+        response.raise_for_status()
+    except requests.RequestException:
+        return {}
+    sums, counts = {}, {}
+    for line in response.text.splitlines():
+        for suffix, target in (('_sum', sums), ('_count', counts)):
+            prefix = f'stage_seconds{suffix}{{stage="'
+            if prefix in line:
+                stage = line.split(prefix, 1)[1].split('"', 1)[0]
+                target[stage] = float(line.rsplit(' ', 1)[1])
+    return {stage: {'count': int(counts[stage]), 'mean_ms': round(sums[stage] / counts[stage] * 1000, 2)}
+            for stage in counts if counts[stage]}
+
+def start_app(ollama_url, core_url, workdir, core_rate, log_level='WARNING'):
+    """Import the app against the stubs with its state under workdir and serve it on a thread.
+
+    Videos are queued but not rendered: Manim renders would compete with
+    the app for the CPU and are not what the endpoints are measured on.
+    """
+    os.environ.update({
+        'OLLAMA_BASE_URL': ollama_url,
+        'CORE_API_URL': core_url,
+        'CORE_API_KEY': 'benchmark',
+        'CORE_RATE_PER_MINUTE': str(core_rate),
+        'DATABASE_URL': f"sqlite:///{os.path.join(workdir, 'aris.db')}",
+        'CACHE_DB_PATH': os.path.join(workdir, 'cache.sqlite3'),
+        'PAPER_INDEX_PATH': os.path.join(workdir, 'papers.sqlite3'),
+        'PLAGIARISM_INDEX_PATH': os.path.join(workdir, 'plagiarism.sqlite3'),
+        'EMBEDDING_INDEX_DIR': os.path.join(workdir, 'embeddings'),
+        'GLYPH_CACHE_DIR': os.path.join(workdir, 'glyph_cache'),
+        'VIDEO_OUTPUT_DIR': os.path.join(workdir, 'videos'),
+        # Summaries still queue their videos, but nothing renders them
+        'RENDER_WORKERS': '0',
+    })
+    from werkzeug.serving import make_server
+    from app import app
+    app.secret_key = app.secret_key or 'benchmark'
+    # The app logs every request at DEBUG, which would dominate the profile
+    for name in (None, 'werkzeug'):
+        logging.getLogger(name).setLevel(log_level.upper())
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='benchmark-app', daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}'
+
+def compare(results, baseline, tolerance):
+    """Regressions of p95 latency or throughput against a baseline result file"""
+    regressions = []
+    for name, current in results['endpoints'].items():
+        previous = baseline.get('endpoints', {}).get(name)
+        if not previous or not previous.get('latency_ms') or not current.get('latency_ms'):
+            continue
+        if current['latency_ms']['p95'] > previous['latency_ms']['p95'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {previous['latency_ms']['p95']} -> {current['latency_ms']['p95']} ms")
+        if current['rps'] < previous['rps'] * (1 - tolerance):
+            regressions.append(f"{name}: {previous['rps']} -> {current['rps']} req/s")
+    return regressions
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--endpoints', default=','.join(DEFAULT_ENDPOINTS),
+                        help=f"comma-separated subset of {', '.join(ENDPOINTS)}")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=20, help='seconds of load per endpoint')
+    parser.add_argument('--distinct', type=int, default=50,
+                        help='distinct payloads per endpoint; fewer means more cache hits')
+    parser.add_argument('--url', help='benchmark an app that is already running instead of starting one')
+    parser.add_argument('--admin-token', default=os.environ.get('ADMIN_TOKEN'))
+    parser.add_argument('--core-rate', type=int, default=6000,
+                        help='CORE_RATE_PER_MINUTE for the in-process app (the app default is 10)')
+    parser.add_argument('--log-level', default='WARNING', help='log level of the in-process app')
+    parser.add_argument('--output', default='benchmark-results.json')
+    parser.add_argument('--baseline', help='result file to compare against')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    stubs.add_arguments(parser)
+    args = parser.parse_args()
+
+    endpoints = [name.strip() for name in args.endpoints.split(',') if name.strip()]
+    unknown = set(endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(sorted(unknown))}")
+
+    workdir = tempfile.mkdtemp(prefix='aris-bench-')
+    url = args.url
+    if url is None:
+        ollama_url, core_url = stubs.start_from_args(args)
+        url = start_app(ollama_url, core_url, workdir, args.core_rate, args.log_level)
+    url = url.rstrip('/')
+
+    results = {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'git_revision': git_revision(),
+        'config': {key: value for key, value in vars(args).items() if key not in ('admin_token', 'baseline')},
+        'endpoints': {}
+    }
+    for name in endpoints:
+        print(f"{name}: {args.concurrency} clients for {args.duration:g}s", file=sys.stderr)
+        result = run_endpoint(name, url, args.concurrency, args.duration, args.distinct)
+        results['endpoints'][name] = result
+        latency = result['latency_ms'] or {}
+        print(f"  {result['requests']} requests, {result['errors']} errors, {result['rps']} req/s, "
+              f"p50 {latency.get('p50')} ms, p95 {latency.get('p95')} ms, p99 {latency.get('p99')} ms",
+              file=sys.stderr)
+    results['stages'] = scrape_stages(url, args.admin_token)
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+"""Local stand-ins for the Ollama and CORE APIs.
+
+Run on their own to benchmark a deployed app:
+
+    python -m benchmarks.stubs --token-rate 30 --core-latency 0.3
+
+then point OLLAMA_BASE_URL and CORE_API_URL at the printed URLs.
+"""
+import sys
+import json
+import time
+import zlib
+import random
+import argparse
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+# Stub defaults: a mid-range GPU running a 7B model, and CORE on a good day
+OLLAMA_TOKEN_RATE = 30.0
+OLLAMA_TOKENS = 200
+OLLAMA_PROMPT_LATENCY = 0.2
+EMBED_DIM = 64
+CORE_LATENCY = 0.3
+CORE_429_RATE = 0.0
+CORE_RETRY_AFTER = 1
+
+def _analysis_text(tokens):
+    # A valid analysis whose summary pads the response to about `tokens` tokens of 4 chars
+    filler = ' '.join(['lorem'] * max(1, (tokens * 4 - 200) // 6))
+    return json.dumps({
+        'summary': f'Benchmark summary {filler}',
+        'key_points': ['first point', 'second point'],
+        'methodology': 'stub methodology',
+        'findings': ['stub finding'],
+        'citations': []
+    })
+
+def _embedding(text, dim):
+    return np.random.default_rng(zlib.crc32(text.encode())).normal(size=dim).round(6).tolist()
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, body, status=200, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+class OllamaHandler(_Handler):
+    """/api/generate (streaming or not) at a fixed token rate, and /api/embed"""
+
+    token_rate = OLLAMA_TOKEN_RATE
+    tokens = OLLAMA_TOKENS
+    prompt_latency = OLLAMA_PROMPT_LATENCY
+    embed_dim = EMBED_DIM
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        path = urlparse(self.path).path
+        if path == '/api/embed':
+            texts = payload['input'] if isinstance(payload['input'], list) else [payload['input']]
+            time.sleep(self.prompt_latency * len(texts) / 32)
+            self._send_json({'model': payload['model'],
+                             'embeddings': [_embedding(text, self.embed_dim) for text in texts],
+                             'prompt_eval_count': sum(len(text) // 4 for text in texts)})
+        elif path == '/api/generate':
+            self._generate(payload)
+        else:
+            self._send_json({'error': 'not found'}, 404)
+
+    def _generate(self, payload):
+        text = _analysis_text(self.tokens)
+        pieces = [text[i:i + 4] for i in range(0, len(text), 4)]
+        usage = {
+            'prompt_eval_count': len(payload.get('prompt', '')) // 4,
+            'eval_count': len(pieces),
+            'eval_duration': int(len(pieces) / self.token_rate * 1e9)
+        }
+        time.sleep(self.prompt_latency)
+        if not payload.get('stream', True):
+            time.sleep(len(pieces) / self.token_rate)
+            self._send_json(dict(usage, model=payload['model'], response=text, done=True))
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        lines = [{'response': piece, 'done': False} for piece in pieces]
+        lines.append(dict(usage, response='', done=True))
+        for line in lines:
+            data = (json.dumps(line) + '\n').encode()
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+            self.wfile.flush()
+            if not line['done']:
+                time.sleep(1 / self.token_rate)
+        self.wfile.write(b'0\r\n\r\n')
+
+class CoreHandler(_Handler):
+    """/search/works with a fixed latency and a share of 429 responses"""
+
+    latency = CORE_LATENCY
+    rate_limited = CORE_429_RATE
+    retry_after = CORE_RETRY_AFTER
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.rstrip('/').split('/')[-2:] != ['search', 'works']:
+            self._send_json({'error': 'not found'}, 404)
+            return
+        time.sleep(random.expovariate(1 / self.latency) if self.latency else 0)
+        if random.random() < self.rate_limited:
+            self._send_json({'message': 'Rate limit exceeded'}, 429, {'Retry-After': str(self.retry_after)})
+            return
+
+        params = parse_qs(url.query)
+        query = params.get('q', [''])[0]
+        page = int(params.get('page', ['1'])[0])
+        page_size = int(params.get('pageSize', ['10'])[0])
+        results = []
+        for i in range(page_size):
+            n = (page - 1) * page_size + i
+            results.append({
+                'title': f'{query.title()} study {n}',
+                'authors': [{'name': 'A. Author'}, {'name': 'B. Author'}],
+                'abstract': f'We study {query} from angle {n}. ' * 8,
+                'doi': f'10.5555/bench.{zlib.crc32(query.encode())}.{n}',
+                'yearPublished': 2000 + n % 25,
+                'publisher': 'Benchmark Press',
+                'downloadUrl': None,
+                'repositoryName': 'bench'
+            })
+        self._send_json({'totalHits': 1000, 'results': results})
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients closing pooled or streamed connections are not errors here
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+def start(handler, port=0, **settings):
+    """Serve handler (with its class settings overridden) on a daemon thread; returns the base URL"""
+    handler = type(handler.__name__, (handler,), settings)
+    server = _Server(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, name=handler.__name__, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}'
+
+def start_ollama(port=0, **settings):
+    return start(OllamaHandler, port, **settings)
+
+def start_core(port=0, **settings):
+    return start(CoreHandler, port, **settings)
+
+def add_arguments(parser):
+    parser.add_argument('--token-rate', type=float, default=OLLAMA_TOKEN_RATE, help='Ollama tokens per second')
+    parser.add_argument('--tokens', type=int, default=OLLAMA_TOKENS, help='tokens per generation')
+    parser.add_argument('--prompt-latency', type=float, default=OLLAMA_PROMPT_LATENCY,
+                        help='seconds before the first token')
+    parser.add_argument('--core-latency', type=float, default=CORE_LATENCY, help='mean CORE latency in seconds')
+    parser.add_argument('--core-429-rate', type=float, default=CORE_429_RATE,
+                        help='share of CORE requests answered with 429')
+    parser.add_argument('--core-retry-after', type=int, default=CORE_RETRY_AFTER,
+                        help='Retry-After sent with each 429')
+
+def start_from_args(args, ollama_port=0, core_port=0):
+    """Start both stubs from parsed arguments; returns (ollama_url, core_url)"""
+    ollama_url = start_ollama(ollama_port, token_rate=args.token_rate, tokens=args.tokens,
+                              prompt_latency=args.prompt_latency)
+    core_url = start_core(core_port, latency=args.core_latency, rate_limited=args.core_429_rate,
+                          retry_after=args.core_retry_after)
+    return ollama_url, core_url
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    parser.add_argument('--ollama-port', type=int, default=11435)
+    parser.add_argument('--core-port', type=int, default=8081)
+    args = parser.parse_args()
+    ollama_url, core_url = start_from_args(args, args.ollama_port, args.core_port)
+    print(f"OLLAMA_BASE_URL={ollama_url}")
+    print(f"CORE_API_URL={core_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,317 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Shared on-disk cache database, used by every gunicorn worker
+CACHE_DB_PATH = os.environ.get("CACHE_DB_PATH", os.path.join("instance", "cache.sqlite3"))
+
+class LRUCache:
+    """Thread-safe in-memory LRU cache bounded by entry count and/or size.
+
+    ``sizeof`` maps a value to its approximate size in bytes; when it is
+    omitted every entry counts as one byte, so ``max_bytes`` acts as a second
+    entry limit.
+    """
+
+    def __init__(self, max_entries=None, max_bytes=None, sizeof=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or (lambda value: 1)
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return self._data[key][0]
+
+    def peek(self, key, default=None):
+        """Value for key without counting a hit or miss or refreshing its recency"""
+        with self._lock:
+            entry = self._data.get(key)
+            return default if entry is None else entry[0]
+
+    def set(self, key, value):
+        size = self.sizeof(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            # Never let one oversized value flush the whole cache
+            self.delete(key)
+            return
+        with self._lock:
+            if key in self._data:
+                self._bytes -= self._data.pop(key)[1]
+            self._data[key] = (value, size)
+            self._bytes += size
+            self._evict()
+
+    def delete(self, key):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry:
+                self._bytes -= entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._data),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def _evict(self):
+        while self._data and (
+                (self.max_entries is not None and len(self._data) > self.max_entries) or
+                (self.max_bytes is not None and self._bytes > self.max_bytes)):
+            _, (_, size) = self._data.popitem(last=False)
+            self._bytes -= size
+
+class SQLiteCache:
+    """Persistent key/value cache stored in a SQLite database.
+
+    Values are stored as JSON, so anything json.dumps accepts can be cached.
+    The database runs in WAL mode so several processes can share it.
+    Entries are grouped by namespace, and each namespace may have a TTL.
+    """
+
+    def __init__(self, path=CACHE_DB_PATH, namespace='default', ttl=None):
+        self.path = path
+        self.namespace = namespace
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('''CREATE TABLE IF NOT EXISTS cache (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                created REAL NOT NULL,
+                expires REAL,
+                PRIMARY KEY (namespace, key)
+            )''')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key, default=None):
+        entry = self.get_entry(key)
+        return default if entry is None else entry[0]
+
+    def get_entry(self, key):
+        """Return (value, expires) for a live entry, or None"""
+        entry = self.peek_entry(key)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def peek_entry(self, key):
+        """get_entry() without counting a hit or miss"""
+        row = self._connect().execute(
+            'SELECT value, expires FROM cache WHERE namespace = ? AND key = ?',
+            (self.namespace, key)).fetchone()
+        if row is None or (row[1] is not None and row[1] < time.time()):
+            return None
+        return json.loads(row[0]), row[1]
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        self._connect().execute(
+            'INSERT OR REPLACE INTO cache (namespace, key, value, created, expires) VALUES (?, ?, ?, ?, ?)',
+            (self.namespace, key, json.dumps(value), now, now + ttl if ttl else None))
+
+    def delete(self, key):
+        self._connect().execute('DELETE FROM cache WHERE namespace = ? AND key = ?', (self.namespace, key))
+
+    def clear(self):
+        self._connect().execute('DELETE FROM cache WHERE namespace = ?', (self.namespace,))
+
+    def purge_expired(self):
+        """Delete expired entries of every namespace"""
+        self._connect().execute('DELETE FROM cache WHERE expires IS NOT NULL AND expires < ?', (time.time(),))
+
+    def drop_namespaces(self, prefix):
+        """Delete entries of other namespaces that start with prefix"""
+        self._connect().execute(
+            'DELETE FROM cache WHERE namespace != ? AND substr(namespace, 1, ?) = ?',
+            (self.namespace, len(prefix), prefix))
+
+    def stats(self):
+        count = self._connect().execute(
+            'SELECT COUNT(*) FROM cache WHERE namespace = ?', (self.namespace,)).fetchone()[0]
+        return {'entries': count, 'hits': self.hits, 'misses': self.misses}
+
+class TieredCache:
+    """An in-memory LRU in front of a SQLiteCache.
+
+    Hits in the disk tier are promoted to memory. Memory entries remember
+    when they expire, so the disk tier's TTL applies to both tiers. Without
+    a disk tier it is a memory-only cache with the given ttl.
+    """
+
+    def __init__(self, memory, disk=None, ttl=None):
+        self.memory = memory
+        self.disk = disk
+        self.ttl = disk.ttl if disk is not None else ttl
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        entry = self.memory.get(key)
+        if entry is not None:
+            value, expires = entry
+            if expires is None or expires >= time.time():
+                self.hits += 1
+                return value
+            self.memory.delete(key)
+
+        if self.disk is None:
+            self.misses += 1
+            return default
+        try:
+            entry = self.disk.get_entry(key)
+        except sqlite3.Error as e:
+            logger.error(f"Cache read failed: {str(e)}")
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return default
+
+        self.memory.set(key, entry)
+        self.hits += 1
+        return entry[0]
+
+    def peek(self, key, default=None):
+        """Value for key without counting a hit or miss or promoting it to memory"""
+        entry = self.memory.peek(key)
+        if entry is not None and (entry[1] is None or entry[1] >= time.time()):
+            return entry[0]
+        if self.disk is None:
+            return default
+        try:
+            entry = self.disk.peek_entry(key)
+        except sqlite3.Error as e:
+            logger.error(f"Cache read failed: {str(e)}")
+            entry = None
+        return default if entry is None else entry[0]
+
+    def set(self, key, value):
+        self.memory.set(key, (value, time.time() + self.ttl if self.ttl else None))
+        if self.disk is None:
+            return
+        try:
+            self.disk.set(key, value)
+        except sqlite3.Error as e:
+            logger.error(f"Cache write failed: {str(e)}")
+
+    def delete(self, key):
+        self.memory.delete(key)
+        if self.disk is not None:
+            self.disk.delete(key)
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'memory': self.memory.stats(),
+            'disk': self.disk.stats() if self.disk is not None else None
+        }
+
+class FlightAbandoned(Exception):
+    """The leader of a single-flight call stopped before producing a result"""
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into one execution.
+
+    The first caller for a key becomes the leader and runs the work; callers
+    that arrive while it is running wait and share its result or exception.
+    """
+
+    def __init__(self):
+        self.coalesced = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def begin(self, key):
+        """Return (flight, is_leader); the leader must call finish()"""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                return flight, False
+            flight = self._flights[key] = _Flight()
+            return flight, True
+
+    def finish(self, key, flight, result=None, error=None):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight.result = result
+        flight.error = error
+        flight.done.set()
+
+    def do(self, key, fn, *args, **kwargs):
+        flight, leader = self.begin(key)
+        if not leader:
+            return flight.wait()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            self.finish(key, flight, error=e)
+            raise
+        self.finish(key, flight, result=result)
+        return result
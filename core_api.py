@@ -1,9 +1,142 @@
 import os
+import json
+import math
+import time
 import requests
 import logging
+import threading
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+from cache import LRUCache, SQLiteCache, TieredCache, SingleFlight
+from metrics import registry, timer
 
 logger = logging.getLogger(__name__)
 
+# CORE client configuration; the quota is per process
+CORE_RATE_PER_MINUTE = float(os.environ.get("CORE_RATE_PER_MINUTE", 10))
+CORE_BURST = int(os.environ.get("CORE_BURST", 5))
+CORE_MAX_WAIT = float(os.environ.get("CORE_MAX_WAIT", 10))
+CORE_MAX_RETRIES = int(os.environ.get("CORE_MAX_RETRIES", 2))
+CORE_POOL_SIZE = int(os.environ.get("CORE_POOL_SIZE", 10))
+CORE_CONNECT_TIMEOUT = float(os.environ.get("CORE_CONNECT_TIMEOUT", 5))
+CORE_READ_TIMEOUT = float(os.environ.get("CORE_READ_TIMEOUT", 20))
+
+# Search cache configuration
+SEARCH_CACHE_TTL = int(os.environ.get("SEARCH_CACHE_TTL", 600))
+SEARCH_CACHE_STALE_TTL = int(os.environ.get("SEARCH_CACHE_STALE_TTL", 3600))
+SEARCH_CACHE_NEGATIVE_TTL = int(os.environ.get("SEARCH_CACHE_NEGATIVE_TTL", 60))
+SEARCH_CACHE_MAX_ENTRIES = int(os.environ.get("SEARCH_CACHE_MAX_ENTRIES", 1024))
+SEARCH_CACHE_SHARED = os.environ.get("SEARCH_CACHE_SHARED", "true").lower() == "true"
+SEARCH_REFRESH_WORKERS = int(os.environ.get("SEARCH_REFRESH_WORKERS", 2))
+SEARCH_PREFETCH_PAGES = int(os.environ.get("SEARCH_PREFETCH_PAGES", 1))
+SEARCH_PREFETCH_MAX_PENDING = int(os.environ.get("SEARCH_PREFETCH_MAX_PENDING", 8))
+
+def _create_search_cache():
+    """Memory LRU, backed by the shared SQLite cache unless SEARCH_CACHE_SHARED is off"""
+    # Entries are kept for the stale window too; freshness is checked per entry
+    ttl = SEARCH_CACHE_TTL + SEARCH_CACHE_STALE_TTL
+    memory = LRUCache(max_entries=SEARCH_CACHE_MAX_ENTRIES)
+    if not SEARCH_CACHE_SHARED:
+        return TieredCache(memory, ttl=ttl)
+    return TieredCache(memory, SQLiteCache(namespace='core_search', ttl=ttl))
+
+core_responses = registry.counter('core_responses_total', 'CORE API responses by HTTP status', ('status',))
+core_rate_limited = registry.counter('core_rate_limited_total', 'CORE searches refused by the local rate limit')
+
+class CoreRateLimited(Exception):
+    """Raised when a CORE request cannot be made within the rate limit"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class TokenBucket:
+    """Thread-safe token bucket for the CORE request quota.
+
+    Tokens refill continuously at ``rate`` per second up to ``capacity``.
+    pause() stops every thread until a server's Retry-After has passed.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._cond = threading.Condition()
+
+    def _wait_time(self, now):
+        self.tokens = min(self.capacity, self.tokens + max(0.0, now - self.updated) * self.rate)
+        self.updated = max(self.updated, now)
+        wait = max(0.0, self.paused_until - now)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+    def wait_time(self):
+        """Seconds until a token will be available"""
+        with self._cond:
+            return self._wait_time(time.monotonic())
+
+    def acquire(self, timeout=0, reserve=0):
+        """Take a token, waiting up to timeout seconds; returns False if none came.
+
+        With a reserve, the token is only taken if that many would be left,
+        and the call never waits.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            if reserve:
+                if self._wait_time(time.monotonic()) == 0 and self.tokens >= 1 + reserve:
+                    self.tokens -= 1
+                    return True
+                return False
+            while True:
+                now = time.monotonic()
+                wait = self._wait_time(now)
+                if wait == 0:
+                    self.tokens -= 1
+                    return True
+                if now + wait > deadline:
+                    return False
+                self._cond.wait(wait)
+
+    def pause(self, seconds):
+        """Hold every caller for seconds, then resume with a single token"""
+        with self._cond:
+            resume = time.monotonic() + seconds
+            if resume > self.paused_until:
+                self.paused_until = resume
+                self.tokens = 1.0
+                self.updated = resume
+
+def _parse_retry_after(value, default):
+    """Seconds to wait from a Retry-After header (delay or HTTP date)"""
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+def format_work(item):
+    """Map a CORE work record to the result fields the app uses"""
+    return {
+        'title': item.get('title'),
+        'authors': [author.get('name') for author in item.get('authors') or []],
+        'abstract': item.get('abstract'),
+        'doi': item.get('doi'),
+        'year': item.get('yearPublished'),
+        'publisher': item.get('publisher'),
+        'pdf_url': item.get('downloadUrl'),
+        'repository': item.get('repositoryName')
+    }
+
 class CoreAPI:
     def __init__(self, api_key=None, api_url=None):
         logger.debug(f"Initializing CoreAPI with api_key={'*' * len(api_key) if api_key else 'None'}")
@@ -17,37 +150,167 @@ class CoreAPI:
         self.base_url = api_url.rstrip('/') if api_url else 'https://api.core.ac.uk/v3'
         logger.debug(f"CoreAPI initialized with base_url: {self.base_url}")
 
-    def search_papers(self, query, page=1, page_size=10):
+        self.timeout = (CORE_CONNECT_TIMEOUT, CORE_READ_TIMEOUT)
+        self.session = requests.Session()
+        self.session.headers.update({'Authorization': f'Bearer {self.api_key}'})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=CORE_POOL_SIZE)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.bucket = TokenBucket(CORE_RATE_PER_MINUTE / 60, CORE_BURST)
+
+        self.cache = _create_search_cache()
+        self._inflight = SingleFlight()
+        self._refreshing = set()
+        self._refresh_lock = threading.Lock()
+        # Shared by stale refreshes and page prefetches, so background work
+        # never takes more than SEARCH_REFRESH_WORKERS connections
+        self._refresh_pool = ThreadPoolExecutor(SEARCH_REFRESH_WORKERS, thread_name_prefix='core-refresh')
+        self.listeners = []
+
+    def add_listener(self, callback):
+        """Call callback(results) with the results of every successful CORE search"""
+        self.listeners.append(callback)
+
+    def _cache_key(self, query, page, page_size):
+        return json.dumps([' '.join(query.lower().split()), page, page_size])
+
+    def search_papers(self, query, page=1, page_size=10, wait=True, prefetch=False):
+        """Search for papers, answering from the cache when possible.
+
+        Fresh entries are returned directly. Stale ones are returned too,
+        while a background refresh fetches a new copy; concurrent misses for
+        the same search share one CORE request. A miss waits up to
+        CORE_MAX_WAIT for the rate limit (or not at all without ``wait``)
+        and raises CoreRateLimited if it cannot be sent in time. With
+        ``prefetch``, the next SEARCH_PREFETCH_PAGES pages are fetched into
+        the cache in the background; their results reach the listeners
+        only once a search returns them.
+        """
+        if page < 1 or page_size < 1:
+            raise ValueError(f"Invalid search page {page} of size {page_size}")
+        key = self._cache_key(query, page, page_size)
+        entry = self.cache.get(key)
+        if entry is not None:
+            if time.time() - entry['fetched'] >= entry['ttl']:
+                self._refresh_in_background(key, query, page, page_size)
+        else:
+            entry = self._inflight.do(key, self._fetch_and_cache, key, query, page, page_size, wait)
+        if entry is None:
+            return None
+        if not entry.get('indexed', True):
+            # Fetched ahead by a prefetch; its results reach the listeners once shown
+            self._mark_indexed(key, entry)
+        data = entry['data']
+
+        if prefetch:
+            last_page = math.ceil(data['total_hits'] / page_size)
+            for next_page in range(page + 1, min(page + SEARCH_PREFETCH_PAGES, last_page) + 1):
+                self._prefetch(query, next_page, page_size)
+        return data
+
+    def peek(self, query, page=1, page_size=10):
+        """A cached search page, stale or not, without contacting CORE; None if not cached.
+
+        Unlike search_papers, looking is not counted in the cache statistics.
+        """
+        entry = self.cache.peek(self._cache_key(query, page, page_size))
+        return entry['data'] if entry is not None else None
+
+    def _notify(self, results):
+        for listener in self.listeners:
+            try:
+                listener(results)
+            except Exception as e:
+                logger.error(f"Search listener failed: {str(e)}")
+
+    def _fetch_and_cache(self, key, query, page, page_size, wait=True, have_token=False, notify=True):
+        """Fetch a page into the cache and return its entry; the listeners only see it with notify"""
+        data = self._fetch(query, page, page_size, wait, have_token)
+        if data is None:
+            return None
+        if notify:
+            self._notify(data['results'])
+        # Empty results are cached briefly so repeated dead-end queries stay local
+        ttl = SEARCH_CACHE_TTL if data['results'] else SEARCH_CACHE_NEGATIVE_TTL
+        entry = {'data': data, 'fetched': time.time(), 'ttl': ttl, 'indexed': notify}
+        self.cache.set(key, entry)
+        return entry
+
+    def _mark_indexed(self, key, entry):
+        with self._refresh_lock:
+            if entry['indexed']:
+                return
+            entry['indexed'] = True
+        self._notify(entry['data']['results'])
+        self.cache.set(key, entry)
+
+    def _prefetch(self, query, page, page_size):
+        key = self._cache_key(query, page, page_size)
+        if self.cache.peek(key) is not None:
+            return
+        with self._refresh_lock:
+            if len(self._refreshing) >= SEARCH_PREFETCH_MAX_PENDING:
+                return
+        self._refresh_in_background(key, query, page, page_size, notify=False)
+
+    def _refresh_in_background(self, key, query, page, page_size, notify=True):
+        with self._refresh_lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                # Only use a token that is left over from foreground searches,
+                # and take it first so a search that joins this flight never
+                # fails for want of one. A failed refresh keeps the stale entry.
+                if not self.bucket.acquire(reserve=1):
+                    logger.debug("Skipped background search, no spare CORE quota")
+                    return
+                self._inflight.do(key, self._fetch_and_cache, key, query, page, page_size, False, True, notify)
+            except CoreRateLimited:
+                logger.debug("Background search stopped by the CORE rate limit")
+            except Exception as e:
+                logger.error(f"Search cache refresh failed: {str(e)}")
+            finally:
+                with self._refresh_lock:
+                    self._refreshing.discard(key)
+        self._refresh_pool.submit(refresh)
+
+    def _send(self, params, wait, have_token=False):
+        """GET a search page within the rate limit, honouring Retry-After on 429"""
+        deadline = time.monotonic() + (CORE_MAX_WAIT if wait else 0)
+        for attempt in range(CORE_MAX_RETRIES + 1):
+            token_taken = have_token and attempt == 0
+            if not token_taken and not self.bucket.acquire(max(0.0, deadline - time.monotonic())):
+                break
+            logger.debug(f"Sending request to CORE API with params: {params}")
+            with timer('core_request'):
+                response = self.session.get(f'{self.base_url}/search/works', params=params, timeout=self.timeout)
+            core_responses.inc(status=response.status_code)
+            if response.status_code != 429:
+                return response
+            retry_after = _parse_retry_after(response.headers.get('Retry-After'), 60 / CORE_RATE_PER_MINUTE)
+            logger.warning(f"CORE API rate limit exceeded, retry after {retry_after:.1f}s")
+            self.bucket.pause(retry_after)
+        core_rate_limited.inc()
+        raise CoreRateLimited("CORE API rate limit reached", retry_after=math.ceil(self.bucket.wait_time()))
+
+    def _fetch(self, query, page, page_size, wait=True, have_token=False):
         """Search for papers using the CORE API"""
         try:
-            headers = {'Authorization': f'Bearer {self.api_key}'}
             params = {
                 'q': query,
                 'page': page,
                 'pageSize': page_size,
                 'entities': 'papers'
             }
-
-            logger.debug(f"Sending request to CORE API with params: {params}")
-            response = requests.get(
-                f'{self.base_url}/search/works',
-                headers=headers,
-                params=params
-            )
+            response = self._send(params, wait, have_token)
 
             if response.status_code == 200:
                 data = response.json()
                 return {
-                    'results': [{
-                        'title': item.get('title'),
-                        'authors': [author.get('name') for author in item.get('authors', [])],
-                        'abstract': item.get('abstract'),
-                        'doi': item.get('doi'),
-                        'year': item.get('yearPublished'),
-                        'publisher': item.get('publisher'),
-                        'pdf_url': item.get('downloadUrl'),
-                        'repository': item.get('repositoryName')
-                    } for item in data.get('results', [])],
+                    'results': [format_work(item) for item in data.get('results', [])],
                     'total_hits': data.get('totalHits', 0),
                     'page': page,
                     'page_size': page_size
@@ -55,13 +318,12 @@ class CoreAPI:
             elif response.status_code == 401:
                 logger.error("Invalid CORE API key")
                 return None
-            elif response.status_code == 429:
-                logger.error("CORE API rate limit exceeded")
-                return None
             else:
                 logger.error(f"CORE API error: {response.status_code}")
                 return None
 
+        except CoreRateLimited:
+            raise
         except Exception as e:
             logger.error(f"Error searching papers: {str(e)}")
             return None
\ No newline at end of file
@@ -1,33 +1,157 @@
+import os
+import sys
+import json
+import queue
 import PyPDF2
 import docx
 import logging
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from metrics import timer
 
-def process_document(filepath):
+# PDF extraction configuration
+PDF_PAGE_WORKERS = int(os.environ.get("PDF_PAGE_WORKERS", os.cpu_count() or 1))
+PDF_PAGES_PER_TASK = int(os.environ.get("PDF_PAGES_PER_TASK", 16))
+PDF_PARALLEL_MIN_PAGES = int(os.environ.get("PDF_PARALLEL_MIN_PAGES", 64))
+PDF_LOW_MEMORY = os.environ.get("PDF_LOW_MEMORY", "false").lower() == "true"
+PDF_WORKER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pdf_worker.py')
+
+_pdf_pool = None
+_pdf_pool_lock = threading.Lock()
+
+def process_document(filepath, workers=None, low_memory=None):
     """Process different document types and extract text content"""
+    with timer('extract'):
+        return ''.join(iter_document(filepath, workers=workers, low_memory=low_memory))
+
+def iter_document(filepath, workers=None, low_memory=None):
+    """Yield the text content of a document piece by piece"""
     try:
         file_extension = filepath.split('.')[-1].lower()
-        
+
         if file_extension == 'pdf':
-            return process_pdf(filepath)
+            yield from iter_pdf_pages(filepath, workers=workers, low_memory=low_memory)
         elif file_extension == 'docx':
-            return process_docx(filepath)
+            yield process_docx(filepath)
         elif file_extension == 'txt':
-            return process_txt(filepath)
+            yield process_txt(filepath)
         else:
             raise ValueError(f"Unsupported file type: {file_extension}")
-            
+
     except Exception as e:
         logging.error(f"Error processing document: {str(e)}")
         raise
 
-def process_pdf(filepath):
+def process_pdf(filepath, workers=None, low_memory=None):
     """Extract text from PDF file"""
-    text = ""
+    return ''.join(iter_pdf_pages(filepath, workers=workers, low_memory=low_memory))
+
+def iter_pdf_pages(filepath, workers=None, low_memory=None):
+    """Yield the text of each PDF page in order.
+
+    Large PDFs are split into page ranges that are extracted in a process
+    pool shared by every upload in this process; each PDF keeps at most
+    two ranges per worker in flight so it cannot starve the others. In
+    low-memory mode the reader is reopened for every page range and at most
+    one range per worker is in flight, so the parsed object cache of a big
+    upload never has to be held in a single process.
+    """
+    workers = PDF_PAGE_WORKERS if workers is None else workers
+    low_memory = PDF_LOW_MEMORY if low_memory is None else low_memory
+
+    with open(filepath, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        page_count = len(pdf_reader.pages)
+        sequential = workers <= 1 or page_count < PDF_PARALLEL_MIN_PAGES
+        if sequential and not low_memory:
+            for page in pdf_reader.pages:
+                yield page.extract_text() or ''
+            return
+        del pdf_reader
+
+    ranges = [(start, min(start + PDF_PAGES_PER_TASK, page_count))
+              for start in range(0, page_count, PDF_PAGES_PER_TASK)]
+
+    if sequential:
+        for start, stop in ranges:
+            yield from _extract_page_range(filepath, start, stop)
+        return
+
+    workers = min(workers, PDF_PAGE_WORKERS, len(ranges))
+    # Finished ranges wait in the parent until their turn to be yielded
+    max_in_flight = workers if low_memory else 2 * workers
+    pool = _get_pdf_pool()
+    pending = []
+    try:
+        remaining = iter(ranges)
+        for start, stop in remaining:
+            pending.append(pool.submit(filepath, start, stop))
+            if len(pending) >= max_in_flight:
+                break
+        while pending:
+            texts = pending.pop(0).result()
+            next_range = next(remaining, None)
+            if next_range:
+                pending.append(pool.submit(filepath, *next_range))
+            yield from texts
+    finally:
+        for future in pending:
+            future.cancel()
+
+class PageWorkerPool:
+    """Page extraction processes shared by every upload in this process.
+
+    Each worker runs pdf_worker.py in a fresh interpreter, so starting one
+    never re-imports the app the way multiprocessing re-runs the caller's
+    main module. Workers are started on demand, reused across PDFs and
+    never more than max_workers of them run at once.
+    """
+
+    def __init__(self, max_workers=PDF_PAGE_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix='pdf-pages')
+        self._idle = queue.LifoQueue()
+
+    def submit(self, filepath, start, stop):
+        """Extract pages [start, stop) in a worker; returns a future of their texts"""
+        return self._executor.submit(self._extract, filepath, start, stop)
+
+    def _extract(self, filepath, start, stop):
+        try:
+            process = self._idle.get_nowait()
+        except queue.Empty:
+            process = subprocess.Popen([sys.executable, PDF_WORKER], stdin=subprocess.PIPE,
+                                       stdout=subprocess.PIPE, text=True, encoding='utf-8')
+        try:
+            process.stdin.write(json.dumps([filepath, start, stop]) + '\n')
+            process.stdin.flush()
+            line = process.stdout.readline()
+        except OSError:
+            line = ''
+        if not line:
+            process.kill()
+            process.wait()
+            raise RuntimeError(f"PDF page worker exited with code {process.returncode}")
+        self._idle.put(process)
+
+        result = json.loads(line)
+        if isinstance(result, dict):
+            raise RuntimeError(result['error'])
+        return result
+
+def _get_pdf_pool():
+    """The page worker pool of this process, created on first use"""
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            _pdf_pool = PageWorkerPool()
+        return _pdf_pool
+
+def _extract_page_range(filepath, start, stop):
+    """Extract the text of pages [start, stop) with a reader of its own"""
     with open(filepath, 'rb') as file:
         pdf_reader = PyPDF2.PdfReader(file)
-        for page in pdf_reader.pages:
-            text += page.extract_text()
-    return text
+        return [pdf_reader.pages[i].extract_text() or '' for i in range(start, stop)]
 
 def process_docx(filepath):
     """Extract text from DOCX file"""
@@ -0,0 +1,232 @@
+import os
+import atexit
+import base64
+import logging
+import threading
+from datetime import datetime
+from sqlalchemy import and_, insert, inspect, or_, text
+from sqlalchemy.exc import SQLAlchemyError
+
+logger = logging.getLogger(__name__)
+
+# Document store configuration
+DOCUMENT_WRITE_BATCH = int(os.environ.get("DOCUMENT_WRITE_BATCH", 100))
+DOCUMENT_WRITE_INTERVAL = float(os.environ.get("DOCUMENT_WRITE_INTERVAL", 1.0))
+DOCUMENT_PAGE_SIZE = 20
+DOCUMENT_PAGE_MAX = 100
+
+def encode_cursor(upload_date, document_id):
+    """Opaque cursor pointing just past a document in newest-first order"""
+    raw = f"{upload_date.isoformat()}|{document_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Return (upload_date, id) from a cursor; raises ValueError if it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        upload_date, document_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(upload_date), int(document_id)
+    except (TypeError, UnicodeDecodeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+class DocumentStore:
+    """Batched persistence of analysed uploads in the ``Document`` table.
+
+    Saves are queued in memory and written by a background thread in one
+    multi-row INSERT per batch, so neither requests nor pipeline workers
+    wait on the database. Rows are unique by content hash: a batch skips
+    hashes that are already stored, and a unique index catches uploads
+    persisted concurrently by another worker.
+    """
+
+    def __init__(self, app, db, document_model, batch_size=DOCUMENT_WRITE_BATCH,
+                 interval=DOCUMENT_WRITE_INTERVAL):
+        self.app = app
+        self.db = db
+        self.Document = document_model
+        self.batch_size = batch_size
+        self.interval = interval
+        self.written = 0
+        self.failed = 0
+        self.unique_hashes = True
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        atexit.register(self.flush)
+
+    def ensure_columns(self):
+        """Add columns that create_all() does not add to an existing table"""
+        table = self.Document.__table__
+        engine = self.db.engine
+        existing = {column['name'] for column in inspect(engine).get_columns(table.name)}
+        quote = engine.dialect.identifier_preparer.quote
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=engine.dialect)
+            try:
+                with engine.begin() as conn:
+                    conn.execute(text(f'ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} {column_type}'))
+                logger.info(f"Added column {column.name} to {table.name}")
+            except SQLAlchemyError as e:
+                # Another worker starting at the same time may have added it
+                if column.name not in {c['name'] for c in inspect(engine).get_columns(table.name)}:
+                    logger.error(f"Failed to add column {column.name}: {str(e)}")
+
+    def ensure_indexes(self):
+        """Create indexes that create_all() does not add to an existing table"""
+        for index in self.Document.__table__.indexes:
+            try:
+                index.create(self.db.engine, checkfirst=True)
+            except SQLAlchemyError as e:
+                logger.error(f"Failed to create index {index.name}: {str(e)}")
+                if index.unique:
+                    # Existing duplicate rows; only the per-batch check de-duplicates
+                    self.unique_hashes = False
+
+    def save(self, content_hash, filename, text, analysis):
+        """Queue an analysed upload for the next batch write"""
+        with self._lock:
+            self._pending.setdefault(content_hash, {
+                'filename': filename,
+                'upload_date': datetime.utcnow(),
+                'content_hash': content_hash,
+                'content': text,
+                'summary': analysis.get('summary') if isinstance(analysis, dict) else None,
+                'analysis': analysis
+            })
+            full = len(self._pending) >= self.batch_size
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='document-writer', daemon=True)
+                self._thread.start()
+        if full:
+            self._wake.set()
+
+    def pending(self, content_hash):
+        """A queued row that has not been written yet, or None"""
+        with self._lock:
+            return self._pending.get(content_hash)
+
+    def flush(self):
+        """Write every queued row now; returns how many new rows were inserted"""
+        with self._flush_lock:
+            with self._lock:
+                rows = list(self._pending.values())
+            if not rows:
+                return 0
+            try:
+                with self.app.app_context():
+                    inserted = self._write(rows)
+            except Exception as e:
+                # Rows stay queued and are retried with the next batch
+                self.failed += 1
+                logger.error(f"Failed to persist {len(rows)} documents: {str(e)}")
+                return 0
+            with self._lock:
+                for row in rows:
+                    if self._pending.get(row['content_hash']) is row:
+                        del self._pending[row['content_hash']]
+            self.written += inserted
+            return inserted
+
+    def _write(self, rows):
+        Document = self.Document
+        hashes = [row['content_hash'] for row in rows]
+        existing = {content_hash for (content_hash,) in self.db.session.query(Document.content_hash)
+                    .filter(Document.content_hash.in_(hashes))}
+        rows = [row for row in rows if row['content_hash'] not in existing]
+        if not rows:
+            return 0
+
+        dialect = self.db.engine.dialect.name if self.unique_hashes else None
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        elif dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            dialect_insert = None
+
+        try:
+            if dialect_insert is not None:
+                # Another worker may have written some of these since the check above;
+                # count only the rows this insert actually added
+                statement = (dialect_insert(Document)
+                             .on_conflict_do_nothing(index_elements=['content_hash'])
+                             .returning(Document.id))
+                inserted = len(self.db.session.execute(statement, rows).all())
+            else:
+                self.db.session.execute(insert(Document), rows)
+                inserted = len(rows)
+            self.db.session.commit()
+        except Exception:
+            self.db.session.rollback()
+            raise
+        return inserted
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+    def find(self, content_hash):
+        """The stored or queued analysis for a hash as {'filename', 'text', 'analysis'}, or None"""
+        row = self.pending(content_hash)
+        if row is None:
+            document = self.Document.query.filter_by(content_hash=content_hash).first()
+            if document is None:
+                return None
+            row = {'filename': document.filename, 'content': document.content, 'analysis': document.analysis}
+        if row['analysis'] is None:
+            return None
+        return {'filename': row['filename'], 'text': row['content'] or '', 'analysis': row['analysis']}
+
+    def page(self, limit=DOCUMENT_PAGE_SIZE, cursor=None):
+        """Return (documents, next_cursor), newest first, without loading text or analyses.
+
+        The cursor is the position of the last document returned, so each
+        page is an index range scan however deep the client has paged.
+        """
+        Document = self.Document
+        limit = max(1, min(limit, DOCUMENT_PAGE_MAX))
+        query = self.db.session.query(Document.id, Document.filename, Document.upload_date,
+                                      Document.content_hash, Document.summary)
+        if cursor:
+            upload_date, document_id = decode_cursor(cursor)
+            query = query.filter(or_(Document.upload_date < upload_date,
+                                     and_(Document.upload_date == upload_date, Document.id < document_id)))
+        rows = query.order_by(Document.upload_date.desc(), Document.id.desc()).limit(limit + 1).all()
+
+        documents = [{
+            'id': row.id,
+            'filename': row.filename,
+            'upload_date': row.upload_date.isoformat() if row.upload_date else None,
+            'content_hash': row.content_hash,
+            'summary': row.summary
+        } for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            next_cursor = encode_cursor(last.upload_date, last.id)
+        return documents, next_cursor
+
+    def get(self, document_id):
+        """A stored document with its analysis, or None"""
+        document = self.db.session.get(self.Document, document_id)
+        if document is None:
+            return None
+        return {
+            'id': document.id,
+            'filename': document.filename,
+            'upload_date': document.upload_date.isoformat() if document.upload_date else None,
+            'content_hash': document.content_hash,
+            'summary': document.summary,
+            'analysis': document.analysis
+        }
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._pending)
+        return {'pending': pending, 'written': self.written, 'failed_batches': self.failed}
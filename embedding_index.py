@@ -0,0 +1,380 @@
+import os
+import math
+import queue
+import sqlite3
+import logging
+import threading
+import numpy as np
+from paper_index import paper_key
+
+logger = logging.getLogger(__name__)
+
+# Embedding index configuration
+EMBEDDING_INDEX_DIR = os.environ.get("EMBEDDING_INDEX_DIR", os.path.join("instance", "embeddings"))
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", 32))
+EMBEDDING_BATCH_WAIT = 1.0
+EMBEDDING_MAX_PENDING = 10000
+EMBEDDING_SEARCH_BLOCK = 65536
+EMBEDDING_INITIAL_ROWS = 1024
+
+# IVF mode: 'auto' switches to probing k-means cells once the index holds
+# EMBEDDING_IVF_MIN_ROWS vectors, 'on' uses it whenever it is trained
+EMBEDDING_IVF = os.environ.get("EMBEDDING_IVF", "auto")
+EMBEDDING_IVF_MIN_ROWS = int(os.environ.get("EMBEDDING_IVF_MIN_ROWS", 50000))
+EMBEDDING_IVF_NPROBE = int(os.environ.get("EMBEDDING_IVF_NPROBE", 8))
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+def top_k(scores, k):
+    """Indices of the k highest scores per row, best first"""
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+    best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, best, axis=1), axis=1)
+    return np.take_along_axis(best, order, axis=1)
+
+class EmbeddingIndex:
+    """Cosine-similarity index over paper embeddings.
+
+    Vectors are L2-normalised float32 rows of a memory-mapped matrix, so the
+    corpus is paged in by the OS instead of loaded into every worker.
+    Metadata and row allocation live in SQLite, which lets several processes
+    append to the same index. Searches are blocked, vectorised dot products
+    over the whole matrix, or, in IVF mode, over the vectors of the k-means
+    cells nearest to each query.
+    """
+
+    def __init__(self, directory=EMBEDDING_INDEX_DIR):
+        self.directory = directory
+        self.db_path = os.path.join(directory, 'meta.sqlite3')
+        self.vectors_path = os.path.join(directory, 'vectors.f32')
+        self.lists_path = os.path.join(directory, 'lists.i32')
+        self.centroids_path = os.path.join(directory, 'centroids.npy')
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._maps = {}
+        self._centroids = (None, None)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(self.directory, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS entries (
+                    row INTEGER PRIMARY KEY,
+                    key TEXT NOT NULL UNIQUE,
+                    source TEXT NOT NULL,
+                    title TEXT,
+                    doi TEXT
+                );
+                CREATE TABLE IF NOT EXISTS settings (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                );
+            ''')
+            self._local.conn = conn
+        return conn
+
+    def _setting(self, name):
+        row = self._connect().execute('SELECT value FROM settings WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else None
+
+    def _map(self, path, dtype, width, mode='r'):
+        """Memory map of a row file, reopened when another process has grown it"""
+        size = os.path.getsize(path)
+        with self._lock:
+            cached = self._maps.get((path, mode))
+            if cached is None or cached[0] != size:
+                rows = size // (np.dtype(dtype).itemsize * width)
+                shape = (rows, width) if width > 1 else (rows,)
+                cached = (size, np.memmap(path, dtype=dtype, mode=mode, shape=shape))
+                self._maps[(path, mode)] = cached
+            return cached[1]
+
+    def _grow(self, rows, dim):
+        # Double the files rather than growing them one batch at a time
+        for path, itemsize in ((self.vectors_path, 4 * dim), (self.lists_path, 4)):
+            current = os.path.getsize(path) // itemsize if os.path.exists(path) else 0
+            if current < rows:
+                with open(path, 'ab') as f:
+                    f.truncate(max(rows, 2 * current, EMBEDDING_INITIAL_ROWS) * itemsize)
+
+    def __len__(self):
+        return self._connect().execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+
+    def missing(self, keys):
+        """The subset of keys that are not indexed yet"""
+        keys = list(keys)
+        if not keys:
+            return set()
+        found = self._connect().execute(
+            f'SELECT key FROM entries WHERE key IN ({",".join("?" * len(keys))})', keys).fetchall()
+        return set(keys) - {row[0] for row in found}
+
+    def add(self, items, vectors):
+        """Append (key, source, title, doi) items with their vectors; known keys are skipped"""
+        vectors = _normalize(vectors)
+        conn = self._connect()
+        # IMMEDIATE takes the write lock up front, so row numbers are ours
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            missing = self.missing(item[0] for item in items)
+            keep = [i for i, item in enumerate(items) if item[0] in missing]
+            if not keep:
+                conn.execute('COMMIT')
+                return 0
+            # Duplicate keys within one batch keep their first vector
+            seen = set()
+            keep = [i for i in keep if not (items[i][0] in seen or seen.add(items[i][0]))]
+
+            dim = self._setting('dim')
+            if dim is None:
+                dim = vectors.shape[1]
+                conn.execute('INSERT INTO settings (name, value) VALUES (?, ?)', ('dim', dim))
+            elif vectors.shape[1] != dim:
+                raise ValueError(f"Embedding has {vectors.shape[1]} dimensions, index expects {dim}")
+
+            start = conn.execute('SELECT COALESCE(MAX(row) + 1, 0) FROM entries').fetchone()[0]
+            stop = start + len(keep)
+            self._grow(stop, dim)
+            matrix = self._map(self.vectors_path, np.float32, dim, 'r+')
+            matrix[start:stop] = vectors[keep]
+            matrix.flush()
+            centroids = self._load_centroids()
+            if centroids is not None:
+                lists = self._map(self.lists_path, np.int32, 1, 'r+')
+                lists[start:stop] = np.argmax(vectors[keep] @ centroids.T, axis=1)
+                lists.flush()
+
+            conn.executemany('INSERT INTO entries (row, key, source, title, doi) VALUES (?, ?, ?, ?, ?)',
+                             [(start + n, *items[i]) for n, i in enumerate(keep)])
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return len(keep)
+
+    def vector(self, key):
+        """Stored vector for a key, or None"""
+        row = self._connect().execute('SELECT row FROM entries WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        return np.array(self._map(self.vectors_path, np.float32, self._setting('dim'))[row[0]])
+
+    def _load_centroids(self):
+        if not os.path.exists(self.centroids_path):
+            return None
+        mtime = os.path.getmtime(self.centroids_path)
+        if self._centroids[0] != mtime:
+            self._centroids = (mtime, np.load(self.centroids_path))
+        return self._centroids[1]
+
+    def _use_ivf(self, count):
+        if EMBEDDING_IVF == 'off':
+            return None
+        centroids = self._load_centroids()
+        if centroids is None or (EMBEDDING_IVF == 'auto' and count < EMBEDDING_IVF_MIN_ROWS):
+            return None
+        return centroids
+
+    def search_batch(self, queries, k=10, nprobe=EMBEDDING_IVF_NPROBE):
+        """Top-k (rows, scores) by cosine similarity for each query vector"""
+        queries = _normalize(np.atleast_2d(queries))
+        count = len(self)
+        if count == 0:
+            empty = np.empty((len(queries), 0))
+            return empty.astype(np.int64), empty
+        matrix = self._map(self.vectors_path, np.float32, self._setting('dim'))[:count]
+
+        centroids = self._use_ivf(count)
+        if centroids is not None:
+            return self._search_ivf(matrix, queries, centroids, k, nprobe)
+
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        for start in range(0, count, EMBEDDING_SEARCH_BLOCK):
+            block = matrix[start:start + EMBEDDING_SEARCH_BLOCK]
+            rows = np.concatenate([best_rows, np.broadcast_to(
+                np.arange(start, start + len(block)), (len(queries), len(block)))], axis=1)
+            scores = np.concatenate([best_scores, queries @ block.T], axis=1)
+            keep = top_k(scores, k)
+            best_rows = np.take_along_axis(rows, keep, axis=1)
+            best_scores = np.take_along_axis(scores, keep, axis=1)
+        return best_rows, best_scores
+
+    def _search_ivf(self, matrix, queries, centroids, k, nprobe):
+        lists = self._map(self.lists_path, np.int32, 1)[:len(matrix)]
+        probes = top_k(queries @ centroids.T, nprobe)
+        all_rows, all_scores = [], []
+        for query, cells in zip(queries, probes):
+            rows = np.flatnonzero(np.isin(lists, cells))
+            scores = matrix[rows] @ query
+            keep = top_k(scores[np.newaxis, :], k)[0]
+            all_rows.append(rows[keep])
+            all_scores.append(scores[keep])
+        width = max(len(rows) for rows in all_rows)
+        pad = lambda values, fill: np.array([np.pad(v, (0, width - len(v)), constant_values=fill) for v in values])
+        return pad(all_rows, -1), pad(all_scores, -np.inf)
+
+    def search(self, vector, k=10, exclude=()):
+        """Top-k matches for one vector as result dicts, best first"""
+        rows, scores = self.search_batch(vector, k + len(exclude))
+        matches = [(int(row), float(score)) for row, score in zip(rows[0], scores[0]) if row >= 0]
+        if not matches:
+            return []
+        meta = dict((row[0], row[1:]) for row in self._connect().execute(
+            f'SELECT row, key, source, title, doi FROM entries WHERE row IN ({",".join("?" * len(matches))})',
+            [row for row, _ in matches]))
+        results = []
+        for row, score in matches:
+            key, source, title, doi = meta[row]
+            if key not in exclude:
+                results.append({'key': key, 'source': source, 'title': title, 'doi': doi, 'score': round(score, 4)})
+        return results[:k]
+
+    def train_ivf(self, cells=None, iterations=10, sample_per_cell=64):
+        """Cluster the vectors with k-means and assign every row to its nearest cell"""
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            count = len(self)
+            if count == 0:
+                conn.execute('COMMIT')
+                return 0
+            cells = cells or max(1, int(math.sqrt(count)))
+            matrix = self._map(self.vectors_path, np.float32, self._setting('dim'))[:count]
+            rng = np.random.default_rng(0)
+            sample = np.array(matrix[np.sort(rng.choice(count, min(count, cells * sample_per_cell), replace=False))])
+            centroids = sample[rng.choice(len(sample), min(cells, len(sample)), replace=False)]
+            for _ in range(iterations):
+                assignment = np.argmax(sample @ centroids.T, axis=1)
+                for cell in range(len(centroids)):
+                    members = sample[assignment == cell]
+                    if len(members):
+                        centroids[cell] = members.mean(axis=0)
+                centroids = _normalize(centroids)
+
+            lists = self._map(self.lists_path, np.int32, 1, 'r+')
+            for start in range(0, count, EMBEDDING_SEARCH_BLOCK):
+                block = matrix[start:start + EMBEDDING_SEARCH_BLOCK]
+                lists[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+            lists.flush()
+
+            temp_path = self.centroids_path + '.tmp.npy'
+            np.save(temp_path, centroids)
+            os.replace(temp_path, self.centroids_path)
+            conn.execute('INSERT OR REPLACE INTO settings (name, value) VALUES (?, ?)', ('ivf_rows', count))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        logger.info(f"Trained {len(centroids)} IVF cells over {count} embeddings")
+        return len(centroids)
+
+    def needs_training(self):
+        """True in auto mode once the index has doubled since the last training"""
+        if EMBEDDING_IVF != 'auto':
+            return False
+        count = len(self)
+        return count >= EMBEDDING_IVF_MIN_ROWS and count >= 2 * (self._setting('ivf_rows') or 0)
+
+    def stats(self):
+        return {
+            'vectors': len(self),
+            'dim': self._setting('dim'),
+            'ivf_cells': None if self._load_centroids() is None else len(self._load_centroids()),
+            'ivf_rows': self._setting('ivf_rows')
+        }
+
+class EmbeddingIndexer:
+    """Embeds new papers in batches on a background thread.
+
+    Listener callbacks only enqueue work, so searches and uploads never wait
+    for the embedding model. Items are sent to the model in batches of up to
+    EMBEDDING_BATCH_SIZE texts.
+    """
+
+    def __init__(self, index, embed, batch_size=EMBEDDING_BATCH_SIZE):
+        self.index = index
+        self.embed = embed
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._queue = queue.Queue(EMBEDDING_MAX_PENDING)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='embedding-indexer', daemon=True)
+                self._thread.start()
+
+    def _pending(self, items):
+        items = [item for item in items if item[4]]
+        if not items:
+            return []
+        missing = self.index.missing(item[0] for item in items)
+        return [item for item in items if item[0] in missing]
+
+    def _enqueue(self, items):
+        items = self._pending(items)
+        if items:
+            self._start()
+        for item in items:
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                self.dropped += 1
+
+    @staticmethod
+    def paper_items(papers, source='core'):
+        """(key, source, title, doi, text) items for papers in search result format"""
+        return [(paper_key(paper), source, paper.get('title'), paper.get('doi'),
+                 f"{paper.get('title') or ''}\n{paper.get('abstract') or ''}")
+                for paper in papers if paper.get('abstract')]
+
+    @staticmethod
+    def document_items(content_hash, filename, analysis):
+        """Items for an analysed upload, embedded by its summary"""
+        summary = analysis.get('summary') if isinstance(analysis, dict) else None
+        return [(f'upload:{content_hash}', 'upload', filename, None, summary)]
+
+    def add_papers(self, papers, source='core'):
+        """Queue the abstracts of papers in search result format"""
+        self._enqueue(self.paper_items(papers, source))
+
+    def add_document(self, content_hash, filename, text, analysis):
+        """Queue the summary of an analysed upload"""
+        self._enqueue(self.document_items(content_hash, filename, analysis))
+
+    def index_now(self, items):
+        """Embed and add (key, source, title, doi, text) items on the calling thread"""
+        items = self._pending(items)
+        added = 0
+        for start in range(0, len(items), self.batch_size):
+            batch = items[start:start + self.batch_size]
+            vectors = self.embed([item[4] for item in batch])
+            added += self.index.add([item[:4] for item in batch], vectors)
+        if self.index.needs_training():
+            self.index.train_ivf()
+        return added
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get(timeout=EMBEDDING_BATCH_WAIT))
+            except queue.Empty:
+                pass
+            try:
+                self.index_now(batch)
+            except Exception as e:
+                logger.error(f"Embedding {len(batch)} papers failed: {str(e)}")
@@ -0,0 +1,152 @@
+import os
+import time
+import uuid
+import fcntl
+import shutil
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Glyph cache configuration
+GLYPH_CACHE_DIR = os.environ.get("GLYPH_CACHE_DIR", os.path.join("instance", "glyph_cache"))
+GLYPH_CACHE_MAX_BYTES = int(os.environ.get("GLYPH_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+GLYPH_STAGING_MAX_AGE = 3600
+
+# Manim keeps compiled LaTeX in tex_dir and rendered Text in text_dir
+GLYPH_KINDS = ('tex', 'text')
+
+class GlyphCache:
+    """Persistent cache of the SVGs Manim compiles for MathTex and Text.
+
+    Manim names each SVG after a hash of the expression or text and its font
+    settings, and skips compilation when the file already exists. Every
+    render works in a private staging directory, and each cached SVG is
+    hard-linked into it when the render first looks it up; new SVGs are
+    linked back into the cache when the render finishes, so concurrent
+    renders never read a half-written file. The least recently used SVGs
+    are pruned once the cache outgrows max_bytes.
+    """
+
+    def __init__(self, root=GLYPH_CACHE_DIR, max_bytes=GLYPH_CACHE_MAX_BYTES):
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _dir(self, kind):
+        return os.path.join(self.root, kind)
+
+    def stage(self):
+        """Create an empty staging directory for a render"""
+        self._remove_stale_staging()
+        staging = os.path.join(self.root, '.staging', uuid.uuid4().hex)
+        for kind in GLYPH_KINDS:
+            os.makedirs(self._dir(kind), exist_ok=True)
+            os.makedirs(os.path.join(staging, kind))
+        return staging
+
+    def fetch(self, kind, name, path):
+        """Link a cached SVG to path; returns False if it is not cached"""
+        try:
+            os.link(os.path.join(self._dir(kind), name), path)
+        except FileNotFoundError:
+            return False
+        except FileExistsError:
+            pass
+        return True
+
+    def publish(self, staging, used=()):
+        """Add the SVGs a render compiled to the cache and remove its staging directory.
+
+        ``used`` lists the (kind, name) of cached SVGs the render read, which
+        are marked as recently used.
+        """
+        added = 0
+        for kind in GLYPH_KINDS:
+            for name in os.listdir(os.path.join(staging, kind)):
+                if not name.endswith('.svg'):
+                    continue
+                try:
+                    os.link(os.path.join(staging, kind, name), os.path.join(self._dir(kind), name))
+                    added += 1
+                except FileExistsError:
+                    pass
+
+        now = time.time()
+        for kind, name in used:
+            try:
+                os.utime(os.path.join(self._dir(kind), name), (now, now))
+            except FileNotFoundError:
+                pass
+
+        shutil.rmtree(staging, ignore_errors=True)
+        if added:
+            self.prune()
+        return added
+
+    def prune(self):
+        """Delete least recently used SVGs until the cache fits in max_bytes"""
+        with open(os.path.join(self.root, '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            entries = []
+            for kind in GLYPH_KINDS:
+                with os.scandir(self._dir(kind)) as it:
+                    for entry in it:
+                        try:
+                            stat = entry.stat()
+                        except FileNotFoundError:
+                            continue
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+            total = sum(size for _, size, _ in entries)
+            removed = 0
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                removed += 1
+            if removed:
+                logger.debug(f"Pruned {removed} glyphs from {self.root}")
+            return removed
+
+    def _remove_stale_staging(self):
+        # Renders that were cancelled or timed out never publish
+        staging_root = os.path.join(self.root, '.staging')
+        if not os.path.isdir(staging_root):
+            return
+        cutoff = time.time() - GLYPH_STAGING_MAX_AGE
+        for name in os.listdir(staging_root):
+            path = os.path.join(staging_root, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    shutil.rmtree(path, ignore_errors=True)
+            except FileNotFoundError:
+                pass
+
+    def record(self, hits, misses):
+        """Add lookup counts reported by a render process"""
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def stats(self):
+        stats = {'hits': self.hits, 'misses': self.misses}
+        for kind in GLYPH_KINDS:
+            entries = 0
+            size = 0
+            if os.path.isdir(self._dir(kind)):
+                with os.scandir(self._dir(kind)) as it:
+                    for entry in it:
+                        try:
+                            size += entry.stat().st_size
+                            entries += 1
+                        except FileNotFoundError:
+                            pass
+            stats[kind] = {'entries': entries, 'bytes': size}
+        return stats
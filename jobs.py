@@ -0,0 +1,47 @@
+import os
+import time
+import uuid
+import threading
+from cache import CACHE_DB_PATH, SQLiteCache
+
+# How long finished jobs can still be polled
+JOB_RETENTION = int(os.environ.get("JOB_RETENTION", 24 * 3600))
+
+class JobStore:
+    """Job state shared across processes through the SQLite cache.
+
+    Status polls may land on a different gunicorn worker than the one
+    running the job, so every update is written through to disk.
+    """
+
+    def __init__(self, namespace='jobs', ttl=JOB_RETENTION):
+        self.disk = SQLiteCache(CACHE_DB_PATH, namespace=namespace, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def create(self, **fields):
+        now = time.time()
+        job = {
+            'id': uuid.uuid4().hex,
+            'status': 'queued',
+            'stage': None,
+            'progress': 0.0,
+            'error': None,
+            'created': now,
+            'updated': now
+        }
+        job.update(fields)
+        self.disk.set(job['id'], job)
+        return job
+
+    def get(self, job_id):
+        return self.disk.get(job_id)
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            job = self.disk.get(job_id)
+            if job is None:
+                return None
+            job.update(fields)
+            job['updated'] = time.time()
+            self.disk.set(job_id, job)
+            return job
@@ -0,0 +1,185 @@
+import os
+import re
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Metrics configuration
+METRICS_PREFIX = os.environ.get("METRICS_PREFIX", "aris")
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+_NAME_RE = re.compile(r'[^a-zA-Z0-9_]')
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Monotonic count per label set"""
+
+    type = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple((name, labels.get(name, '')) for name in self.labelnames)
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+class Histogram(Counter):
+    """Bucketed distribution of observations per label set"""
+
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # One slot per bucket, then +Inf, count is the sum of the slots
+                counts = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            counts[0][bisect.bisect_left(self.buckets, value)] += 1
+            counts[1] += value
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total) in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += count
+                    samples.append((self.name + '_bucket', key + (('le', _format_value(bound)),), cumulative))
+                samples.append((self.name + '_sum', key, total))
+                samples.append((self.name + '_count', key, cumulative))
+        return samples
+
+class Registry:
+    """Metrics of this process, rendered in the Prometheus text format.
+
+    Collectors are callables returning (name, type, help, [(labels, value)])
+    tuples; they report values other components already keep, such as cache
+    hit counters, at scrape time.
+    """
+
+    def __init__(self, prefix=METRICS_PREFIX):
+        self.prefix = prefix
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, help, labelnames, **kwargs):
+        name = f'{self.prefix}_{name}' if self.prefix else name
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = cls(name, help, labelnames, **kwargs)
+            return self._metrics[name]
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(Counter, name, help, labelnames)
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram, name, help, labelnames, buckets=buckets)
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+
+        for collector in self._collectors:
+            try:
+                families = list(collector())
+            except Exception as e:
+                logger.error(f"Metrics collector failed: {str(e)}")
+                continue
+            for name, type, help, samples in families:
+                name = _NAME_RE.sub('_', f'{self.prefix}_{name}' if self.prefix else name)
+                lines.append(f'# HELP {name} {help}')
+                lines.append(f'# TYPE {name} {type}')
+                for labels, value in samples:
+                    if value is None:
+                        continue
+                    lines.append(f'{name}{_format_labels(sorted(labels.items()))} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+# Shared by every module in this process
+registry = Registry()
+
+stage_seconds = registry.histogram('stage_seconds', 'Time spent in each processing stage', ('stage',))
+
+_local = threading.local()
+
+def begin_request():
+    """Start collecting stage timings for the current request thread"""
+    _local.timings = []
+    _local.started = time.perf_counter()
+
+def end_request():
+    """Return (total seconds, [(stage, seconds)]) for the current request and stop collecting"""
+    timings = getattr(_local, 'timings', None)
+    _local.timings = None
+    if timings is None:
+        return None, []
+    return time.perf_counter() - _local.started, timings
+
+def record_stage(stage, seconds):
+    """Record a stage duration measured by the caller"""
+    stage_seconds.observe(seconds, stage=stage)
+    timings = getattr(_local, 'timings', None)
+    if timings is not None:
+        timings.append((stage, seconds))
+
+@contextmanager
+def timer(stage):
+    """Time the block as one run of stage"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started)
+
+def server_timing(total, timings):
+    """Server-Timing header value, summing repeated stages"""
+    durations = {}
+    for stage, seconds in timings:
+        durations[stage] = durations.get(stage, 0) + seconds
+    entries = [f'{_NAME_RE.sub("_", stage)};dur={seconds * 1000:.1f}' for stage, seconds in durations.items()]
+    entries.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(entries)
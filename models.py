@@ -5,5 +5,14 @@ class Document(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(255), nullable=False)
     upload_date = db.Column(db.DateTime, default=datetime.utcnow)
+    content_hash = db.Column(db.String(64))
+    content = db.Column(db.Text)
     summary = db.Column(db.Text)
     analysis = db.Column(db.JSON)
+
+    __table_args__ = (
+        # One row per distinct upload
+        db.Index('ux_document_content_hash', 'content_hash', unique=True),
+        # Newest-first keyset pagination
+        db.Index('ix_document_upload_date_id', 'upload_date', 'id'),
+    )
@@ -0,0 +1,354 @@
+import os
+import re
+import gzip
+import json
+import time
+import sqlite3
+import logging
+import threading
+from core_api import CoreRateLimited, format_work
+from metrics import timer
+
+logger = logging.getLogger(__name__)
+
+# Paper index configuration
+PAPER_INDEX_PATH = os.environ.get("PAPER_INDEX_PATH", os.path.join("instance", "papers.sqlite3"))
+PAPER_INDEX_BATCH = 1000
+
+# bm25() column weights for title, authors, abstract, content
+BM25_WEIGHTS = (10.0, 3.0, 2.0, 1.0)
+# Local match counts shown as a total stop here
+LOCAL_COUNT_LIMIT = 1000
+# CORE pages one merged page may fetch while skipping papers listed locally
+MERGED_REMOTE_PAGES = 3
+
+_TOKEN_RE = re.compile(r'\w+')
+
+_COLUMNS = ['title', 'authors', 'abstract', 'content', 'doi', 'year', 'publisher', 'pdf_url', 'repository']
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS papers (
+    id INTEGER PRIMARY KEY,
+    paper_key TEXT NOT NULL UNIQUE,
+    source TEXT NOT NULL,
+    title TEXT,
+    authors TEXT,
+    abstract TEXT,
+    content TEXT,
+    doi TEXT,
+    year INTEGER,
+    publisher TEXT,
+    pdf_url TEXT,
+    repository TEXT,
+    updated REAL NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS papers_fts USING fts5(
+    title, authors, abstract, content,
+    content='papers', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS papers_ai AFTER INSERT ON papers BEGIN
+    INSERT INTO papers_fts(rowid, title, authors, abstract, content)
+    VALUES (new.id, new.title, new.authors, new.abstract, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS papers_ad AFTER DELETE ON papers BEGIN
+    INSERT INTO papers_fts(papers_fts, rowid, title, authors, abstract, content)
+    VALUES ('delete', old.id, old.title, old.authors, old.abstract, old.content);
+END;
+CREATE TRIGGER IF NOT EXISTS papers_au AFTER UPDATE ON papers BEGIN
+    INSERT INTO papers_fts(papers_fts, rowid, title, authors, abstract, content)
+    VALUES ('delete', old.id, old.title, old.authors, old.abstract, old.content);
+    INSERT INTO papers_fts(rowid, title, authors, abstract, content)
+    VALUES (new.id, new.title, new.authors, new.abstract, new.content);
+END;
+'''
+
+def paper_key(paper):
+    """Identity of a paper for de-duplication: its DOI, else its title and year"""
+    if paper.get('doi'):
+        return 'doi:' + paper['doi'].strip().lower()
+    title = ' '.join(_TOKEN_RE.findall((paper.get('title') or '').lower()))
+    return f"title:{title}:{paper.get('year') or ''}"
+
+def match_expression(query):
+    """FTS5 query requiring every word of query, treating the last as a prefix"""
+    tokens = _TOKEN_RE.findall(query.lower())
+    if not tokens:
+        return None
+    return ' '.join([f'"{token}"' for token in tokens[:-1]] + [f'"{tokens[-1]}"*'])
+
+class PaperIndex:
+    """Local full-text index of paper metadata, ranked with BM25.
+
+    Holds every CORE result the app has fetched and every analysed upload
+    in a SQLite FTS5 table, so searches can be answered without a round
+    trip to CORE.
+    """
+
+    def __init__(self, path=PAPER_INDEX_PATH):
+        self.path = path
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def add_papers(self, papers, source='core'):
+        """Insert or refresh papers in result format; returns how many were written"""
+        now = time.time()
+        rows = []
+        for paper in papers:
+            if not paper.get('title'):
+                continue
+            row = dict(paper, authors=json.dumps(paper.get('authors') or []))
+            rows.append([paper.get('paper_key') or paper_key(paper), source, now] +
+                        [row.get(column) for column in _COLUMNS])
+        if not rows:
+            return 0
+
+        # Keep fields a sparser record (e.g. one without an abstract) lacks
+        updates = ', '.join(f'{column} = COALESCE(excluded.{column}, {column})' for column in _COLUMNS)
+        conn = self._connect()
+        conn.execute('BEGIN')
+        try:
+            conn.executemany(
+                f'''INSERT INTO papers (paper_key, source, updated, {', '.join(_COLUMNS)})
+                    VALUES ({', '.join('?' * (len(_COLUMNS) + 3))})
+                    ON CONFLICT(paper_key) DO UPDATE SET {updates}, updated = excluded.updated''',
+                rows)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return len(rows)
+
+    def add_document(self, content_hash, filename, text, analysis):
+        """Index an analysed upload under its content hash"""
+        summary = analysis.get('summary') if isinstance(analysis, dict) else None
+        self.add_papers([{
+            'paper_key': f'upload:{content_hash}',
+            'title': filename,
+            'abstract': summary,
+            'content': text
+        }], source='upload')
+
+    def search(self, query, limit=10, offset=0, snapshot=None):
+        """Matches for a query, best BM25 match first.
+
+        With a snapshot (see last_id) only papers indexed before it match.
+        """
+        expression = match_expression(query)
+        if expression is None:
+            return []
+        weights = ', '.join(str(weight) for weight in BM25_WEIGHTS)
+        rows = self._connect().execute(
+            f'''SELECT p.source, p.title, p.authors, p.abstract, p.doi, p.year, p.publisher,
+                       p.pdf_url, p.repository
+                FROM papers_fts JOIN papers p ON p.id = papers_fts.rowid
+                WHERE papers_fts MATCH ? AND (? IS NULL OR p.id <= ?)
+                ORDER BY bm25(papers_fts, {weights})
+                LIMIT ? OFFSET ?''',
+            (expression, snapshot, snapshot, limit, offset)).fetchall()
+        return [{
+            'title': row[1],
+            'authors': json.loads(row[2] or '[]'),
+            'abstract': row[3],
+            'doi': row[4],
+            'year': row[5],
+            'publisher': row[6],
+            'pdf_url': row[7],
+            'repository': row[8],
+            'source': row[0]
+        } for row in rows]
+
+    def count(self, query, limit=LOCAL_COUNT_LIMIT, snapshot=None):
+        """Number of matches for a query, counting no further than limit"""
+        expression = match_expression(query)
+        if expression is None:
+            return 0
+        return self._connect().execute(
+            '''SELECT COUNT(*) FROM (
+                   SELECT 1 FROM papers_fts JOIN papers p ON p.id = papers_fts.rowid
+                   WHERE papers_fts MATCH ? AND (? IS NULL OR p.id <= ?) LIMIT ?)''',
+            (expression, snapshot, snapshot, limit)).fetchone()[0]
+
+    def matching_keys(self, query, keys, snapshot=None):
+        """The subset of paper keys that search() would return for a query"""
+        expression = match_expression(query)
+        keys = list(keys)
+        if expression is None or not keys:
+            return set()
+        rows = self._connect().execute(
+            f'''SELECT p.paper_key FROM papers_fts JOIN papers p ON p.id = papers_fts.rowid
+                WHERE papers_fts MATCH ? AND (? IS NULL OR p.id <= ?)
+                  AND p.paper_key IN ({",".join("?" * len(keys))})''',
+            [expression, snapshot, snapshot] + keys).fetchall()
+        return {row[0] for row in rows}
+
+    def last_id(self):
+        """Id of the newest paper; rows keep their id when refreshed"""
+        return self._connect().execute('SELECT COALESCE(MAX(id), 0) FROM papers').fetchone()[0]
+
+    def ingest_dump(self, path):
+        """Bulk-load a CORE data dump into the index"""
+        return sum(self.add_papers(batch) for batch in read_core_dump(path))
+
+    def stats(self):
+        rows = self._connect().execute('SELECT source, COUNT(*) FROM papers GROUP BY source').fetchall()
+        return dict(rows)
+
+def read_core_dump(path, batch_size=PAPER_INDEX_BATCH):
+    """Yield batches of papers from a CORE data dump of JSON lines (optionally gzipped)"""
+    opener = gzip.open if path.endswith('.gz') else open
+    batch = []
+    with opener(path, 'rt', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                batch.append(format_work(json.loads(line)))
+            except ValueError as e:
+                logger.error(f"Skipping line {line_number} of {path}: {str(e)}")
+                continue
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+def merged_search(index, core_api, query, page=1, page_size=10, prefetch=False, snapshot=None):
+    """Page through local matches followed by CORE's results as one list.
+
+    The list is every indexed match, papers from earlier CORE responses
+    included, in BM25 order, then CORE's results in CORE's order minus the
+    papers already listed locally. The local section is fixed by a snapshot
+    taken on the first page and returned with every page; pass it back for
+    the next one so the papers each page indexes never reorder the list. A
+    page the local section fills never reaches CORE. When CORE is
+    unavailable or rate limited, the page is answered from everything
+    indexed instead.
+    """
+    offset = (page - 1) * page_size
+    try:
+        with timer('search_local'):
+            if snapshot is None:
+                snapshot = index.last_id()
+            local = index.search(query, page_size, offset, snapshot)
+            if 0 < len(local) < page_size or (offset == 0 and not local):
+                local_count = offset + len(local)
+            elif not local:
+                # Every local match is on an earlier page; no need to count past this one
+                local_count = index.count(query, offset, snapshot)
+            else:
+                local_count = index.count(query, snapshot=snapshot)
+    except sqlite3.Error as e:
+        logger.error(f"Local paper search failed: {str(e)}")
+        local, local_count = [], 0
+
+    def result(results, total):
+        return {'results': results, 'total_hits': total, 'page': page, 'page_size': page_size,
+                'snapshot': snapshot}
+
+    if len(local) >= page_size:
+        cached = core_api.peek(query, 1, page_size)
+        total = local_count
+        if cached:
+            total += cached['total_hits'] - len(_listed(index, query, snapshot, cached['results']))
+        return result(local, total)
+
+    try:
+        remote = _remote_results(index, core_api, query, snapshot, offset + len(local) - local_count,
+                                 page_size - len(local), page_size, prefetch)
+    except CoreRateLimited:
+        if not local:
+            indexed = _indexed_page(index, query, page, page_size)
+            if indexed is None:
+                raise
+            return indexed
+        remote = None
+    if remote is None:
+        if not local:
+            return _indexed_page(index, query, page, page_size)
+        return result(local, local_count)
+
+    papers, remote_total, listed, exhausted = remote
+    if exhausted and (local or papers):
+        # The last page: everything before it is known
+        return result(local + papers, offset + len(local) + len(papers))
+    return result(local + papers, local_count + remote_total - listed)
+
+def _listed(index, query, snapshot, papers):
+    """Keys of papers that are also in the local section of a merged search"""
+    try:
+        return index.matching_keys(query, (paper_key(paper) for paper in papers), snapshot)
+    except sqlite3.Error as e:
+        logger.error(f"Local paper lookup failed: {str(e)}")
+        return set()
+
+def _remote_results(index, core_api, query, snapshot, start, needed, page_size, prefetch):
+    """CORE results [start, start + needed) once papers listed locally are dropped.
+
+    Returns (results, CORE's total, papers listed locally seen on the way,
+    whether CORE ran out), or None if CORE failed. Listed papers on earlier pages are skipped only
+    as far as those pages are still cached; the rest are not fetched again
+    just to find them.
+    """
+    total = 0
+    listed = 0
+    position = start
+    remote_page = 1
+    while (remote_page - 1) * page_size < position:
+        data = core_api.peek(query, remote_page, page_size)
+        if data is None:
+            break
+        first = (remote_page - 1) * page_size
+        total = data['total_hits']
+        keys = _listed(index, query, snapshot, data['results'])
+        for i, paper in enumerate(data['results']):
+            if first + i >= position:
+                break
+            if paper_key(paper) in keys:
+                position += 1
+                listed += 1
+        remote_page += 1
+
+    results = []
+    exhausted = False
+    remote_page, skip = position // page_size + 1, position % page_size
+    for fetched in range(MERGED_REMOTE_PAGES):
+        data = core_api.search_papers(query, page=remote_page, page_size=page_size, prefetch=prefetch)
+        if data is None:
+            return None
+        total = data['total_hits']
+        keys = _listed(index, query, snapshot, data['results'])
+        for paper in data['results'][skip:]:
+            if paper_key(paper) in keys:
+                listed += 1
+            elif len(results) < needed:
+                results.append(paper)
+        exhausted = not data['results'] or remote_page * page_size >= total
+        if len(results) >= needed or exhausted:
+            break
+        remote_page, skip = remote_page + 1, 0
+    return results, total, listed, exhausted
+
+def _indexed_page(index, query, page, page_size):
+    """A page from everything indexed, for when CORE cannot be reached"""
+    try:
+        results = index.search(query, page_size, (page - 1) * page_size)
+        total = index.count(query)
+    except sqlite3.Error as e:
+        logger.error(f"Local paper search failed: {str(e)}")
+        results, total = [], 0
+    if not results:
+        return None
+    return {'results': results, 'total_hits': total, 'page': page, 'page_size': page_size, 'snapshot': None}
@@ -0,0 +1,24 @@
+"""Entrypoint of PDF page extraction workers, so starting one never imports the app.
+
+Reads one JSON request [filepath, start, stop] per line from stdin and
+answers each with one line of JSON on stdout: the list of page texts, or
+{"error": message}. Exits when stdin is closed.
+"""
+import sys
+import json
+from document_processor import _extract_page_range
+
+def main():
+    # Keep stray prints from the PDF library out of the replies
+    replies, sys.stdout = sys.stdout, sys.stderr
+    for line in sys.stdin:
+        filepath, start, stop = json.loads(line)
+        try:
+            result = _extract_page_range(filepath, start, stop)
+        except Exception as e:
+            result = {'error': f"{type(e).__name__}: {str(e)}"}
+        replies.write(json.dumps(result) + '\n')
+        replies.flush()
+
+if __name__ == '__main__':
+    main()
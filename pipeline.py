@@ -0,0 +1,134 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from document_processor import process_document
+from ai_analyzer import PRIORITY_ANALYSIS, SchedulerBusy, analyze_chunks, chunk_text
+from jobs import JobStore
+from metrics import registry, timer
+
+logger = logging.getLogger(__name__)
+
+# Pipeline configuration
+PIPELINE_EXTRACT_WORKERS = int(os.environ.get("PIPELINE_EXTRACT_WORKERS", 2))
+PIPELINE_ANALYZE_WORKERS = int(os.environ.get("PIPELINE_ANALYZE_WORKERS", 2))
+PIPELINE_MAX_PENDING = int(os.environ.get("PIPELINE_MAX_PENDING", 32))
+PIPELINE_BUSY_RETRIES = int(os.environ.get("PIPELINE_BUSY_RETRIES", 5))
+
+STAGES = ['extract', 'chunk', 'analyze', 'persist']
+
+job_seconds = registry.histogram('analysis_job_seconds', 'Upload analysis time from submit to finish', ('status',))
+
+class PipelineBusy(Exception):
+    """Raised when the pipeline already holds PIPELINE_MAX_PENDING jobs"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class AnalysisPipeline:
+    """Staged upload analysis: extract -> chunk -> analyze -> persist.
+
+    Each stage runs on its own worker pool and hands its output to the next
+    stage, so a slow Ollama call never holds an extraction worker and the
+    HTTP request returns as soon as the upload is saved.
+    """
+
+    def __init__(self, app, upload_cache, jobs=None):
+        self.app = app
+        self.upload_cache = upload_cache
+        self.jobs = jobs or JobStore()
+        self._pools = {
+            'extract': ThreadPoolExecutor(PIPELINE_EXTRACT_WORKERS, thread_name_prefix='extract'),
+            'chunk': ThreadPoolExecutor(1, thread_name_prefix='chunk'),
+            'analyze': ThreadPoolExecutor(PIPELINE_ANALYZE_WORKERS, thread_name_prefix='analyze'),
+            'persist': ThreadPoolExecutor(1, thread_name_prefix='persist'),
+        }
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, filepath, filename, content_hash):
+        """Queue an uploaded file for analysis and return its job"""
+        cached = self.upload_cache.get(content_hash)
+        if cached is not None:
+            logger.debug(f"Upload cache hit for {content_hash}")
+            os.remove(filepath)
+            return self.jobs.create(filename=filename, content_hash=content_hash,
+                                    status='done', progress=1.0, result=cached['analysis'])
+
+        with self._lock:
+            if self._pending >= PIPELINE_MAX_PENDING:
+                os.remove(filepath)
+                raise PipelineBusy("Too many documents are being analyzed. Please try again shortly.", retry_after=30)
+            self._pending += 1
+
+        job = self.jobs.create(filename=filename, content_hash=content_hash)
+        self._pools['extract'].submit(self._run, 0, job['id'], filepath)
+        return job
+
+    def _run(self, stage_index, job_id, payload):
+        stage = STAGES[stage_index]
+        try:
+            job = self.jobs.get(job_id)
+            if job is None:
+                # Expired from the job store; still release its pending slot
+                raise LookupError(f"Job {job_id} no longer exists")
+            self.jobs.update(job_id, status='running', stage=stage,
+                             progress=max(job['progress'], stage_index / len(STAGES)))
+            with timer(f'pipeline_{stage}'):
+                result = getattr(self, f'_{stage}')(job_id, payload)
+        except Exception as e:
+            logger.error(f"Analysis job {job_id} failed in {stage}: {str(e)}")
+            self._finish(job_id, status='failed', error=str(e))
+            if stage == 'extract' and os.path.exists(payload):
+                os.remove(payload)
+            return
+
+        if stage_index + 1 < len(STAGES):
+            self._pools[STAGES[stage_index + 1]].submit(self._run, stage_index + 1, job_id, result)
+        else:
+            self._finish(job_id, status='done', progress=1.0, result=result)
+
+    def _finish(self, job_id, **fields):
+        with self._lock:
+            self._pending -= 1
+        job = self.jobs.update(job_id, **fields)
+        if job is not None:
+            job_seconds.observe(job['updated'] - job['created'], status=job['status'])
+
+    def _extract(self, job_id, filepath):
+        try:
+            return process_document(filepath)
+        finally:
+            if os.path.exists(filepath):
+                os.remove(filepath)
+
+    def _chunk(self, job_id, text):
+        chunks = chunk_text(text) or [text]
+        self.jobs.update(job_id, chunks=len(chunks))
+        return text, chunks
+
+    def _analyze(self, job_id, payload):
+        text, chunks = payload
+        base = STAGES.index('analyze') / len(STAGES)
+
+        def on_chunk_done(completed, total):
+            self.jobs.update(job_id, progress=base + completed / total / len(STAGES))
+
+        for attempt in range(PIPELINE_BUSY_RETRIES + 1):
+            try:
+                return text, analyze_chunks(chunks, PRIORITY_ANALYSIS, on_chunk_done)
+            except SchedulerBusy as e:
+                # The job is already off the request path, so wait rather than fail
+                if attempt == PIPELINE_BUSY_RETRIES:
+                    raise
+                logger.debug(f"Ollama busy, retrying job {job_id} in {e.retry_after}s")
+                time.sleep(e.retry_after)
+
+    def _persist(self, job_id, payload):
+        text, analysis = payload
+        job = self.jobs.get(job_id)
+        with self.app.app_context():
+            self.upload_cache.put(job['content_hash'], job['filename'], text, analysis)
+        return analysis
@@ -0,0 +1,263 @@
+import os
+import re
+import html
+import zlib
+import sqlite3
+import hashlib
+import logging
+import threading
+import numpy as np
+from paper_index import paper_key
+
+logger = logging.getLogger(__name__)
+
+# Plagiarism index configuration
+PLAGIARISM_INDEX_PATH = os.environ.get("PLAGIARISM_INDEX_PATH", os.path.join("instance", "plagiarism.sqlite3"))
+SHINGLE_SIZE = int(os.environ.get("PLAGIARISM_SHINGLE_SIZE", 5))
+MIN_SIMILARITY = float(os.environ.get("PLAGIARISM_MIN_SIMILARITY", 0.05))
+MAX_MATCHES = 10
+MAX_CANDIDATES = 2000
+BUCKET_LIMIT = 1000
+# (band, bucket) pairs looked up per query; two SQL variables each
+BUCKET_BATCH = 400
+# Window pairs compared per numpy block
+COMPARE_BLOCK = 4096
+
+# Texts are indexed as overlapping windows so a copied paragraph of a long
+# paper is compared with a passage of similar length, not the whole paper
+WINDOW_WORDS = int(os.environ.get("PLAGIARISM_WINDOW_WORDS", 100))
+INDEX_STRIDE = WINDOW_WORDS // 2
+QUERY_STRIDE = WINDOW_WORDS // 4
+# Estimated Jaccard similarity above which two windows count as a match
+WINDOW_MATCH = 0.3
+
+# 42 bands of 3 rows put the LSH threshold, (1/bands)^(1/rows), at ~0.29,
+# just under WINDOW_MATCH; the last two permutations only refine estimates
+NUM_PERM = 128
+LSH_BANDS = 42
+LSH_ROWS = 3
+# Stored as the index's user_version; the bands are rebuilt when it changes
+_LSH_LAYOUT = LSH_BANDS << 8 | LSH_ROWS
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+# Fixed seed: signatures are persisted, so every process must use the same permutations
+_rng = np.random.default_rng(42)
+_PERM_A = _rng.integers(1, _MERSENNE_PRIME, NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.integers(0, _MERSENNE_PRIME, NUM_PERM, dtype=np.uint64)
+
+_TAG_RE = re.compile(r'<[^>]+>')
+_WORD_RE = re.compile(r'\w+')
+
+def words(text):
+    """Lower-cased words of text, ignoring markup and punctuation"""
+    return _WORD_RE.findall(html.unescape(_TAG_RE.sub(' ', text or '')).lower())
+
+def shingles(words, size=SHINGLE_SIZE):
+    """Hashed word n-grams of a list of words"""
+    grams = {' '.join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+    return np.fromiter((zlib.crc32(gram.encode()) for gram in grams), dtype=np.uint64, count=len(grams))
+
+def windows(words, stride, size=WINDOW_WORDS):
+    """Overlapping slices of size words every stride words, the last one ending the text"""
+    if len(words) <= size:
+        return [words] if words else []
+    starts = list(range(0, len(words) - size + 1, stride))
+    if starts[-1] != len(words) - size:
+        starts.append(len(words) - size)
+    return [words[start:start + size] for start in starts]
+
+def minhash(hashes, batch_size=8192):
+    """MinHash signature (NUM_PERM uint32 values) of a set of shingle hashes"""
+    signature = np.full(NUM_PERM, _MAX_HASH, dtype=np.uint64)
+    for start in range(0, len(hashes), batch_size):
+        batch = hashes[start:start + batch_size, np.newaxis]
+        # uint64 wrap-around is part of the hash family, as in datasketch
+        with np.errstate(over='ignore'):
+            permuted = ((batch * _PERM_A + _PERM_B) % _MERSENNE_PRIME) & _MAX_HASH
+        np.minimum(signature, permuted.min(axis=0), out=signature)
+    return signature.astype(np.uint32)
+
+def band_buckets(signature):
+    """One bucket id per LSH band"""
+    bands = signature[:LSH_BANDS * LSH_ROWS].reshape(LSH_BANDS, LSH_ROWS)
+    return [int.from_bytes(hashlib.blake2b(band.tobytes(), digest_size=8).digest(), 'little', signed=True)
+            for band in bands]
+
+class PlagiarismIndex:
+    """Persistent MinHash/LSH index for near-duplicate text detection.
+
+    Every indexed text is cut into overlapping windows of WINDOW_WORDS
+    words. Each window is stored as a MinHash signature of its word
+    shingles and filed under one bucket per LSH band. A check only compares
+    against windows that share at least one bucket, so lookups stay fast as
+    the corpus grows; documents are added incrementally as they arrive.
+    """
+
+    def __init__(self, path=PLAGIARISM_INDEX_PATH):
+        self.path = path
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS documents (
+                    id INTEGER PRIMARY KEY,
+                    doc_key TEXT NOT NULL UNIQUE,
+                    source TEXT NOT NULL,
+                    label TEXT
+                );
+                CREATE TABLE IF NOT EXISTS windows (
+                    id INTEGER PRIMARY KEY,
+                    doc_id INTEGER NOT NULL,
+                    signature BLOB NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS bands (
+                    band INTEGER NOT NULL,
+                    bucket INTEGER NOT NULL,
+                    window_id INTEGER NOT NULL,
+                    PRIMARY KEY (band, bucket, window_id)
+                ) WITHOUT ROWID;
+            ''')
+            if conn.execute('PRAGMA user_version').fetchone()[0] != _LSH_LAYOUT:
+                self._rebuild_bands(conn)
+            self._local.conn = conn
+        return conn
+
+    def _rebuild_bands(self, conn):
+        """File every stored signature under the current band layout"""
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Another process may have rebuilt them while this one waited
+            if conn.execute('PRAGMA user_version').fetchone()[0] != _LSH_LAYOUT:
+                conn.execute('DELETE FROM bands')
+                for window_id, blob in conn.execute('SELECT id, signature FROM windows').fetchall():
+                    conn.executemany('INSERT OR IGNORE INTO bands (band, bucket, window_id) VALUES (?, ?, ?)',
+                                     [(band, bucket, window_id) for band, bucket in
+                                      enumerate(band_buckets(np.frombuffer(blob, dtype=np.uint32)))])
+                conn.execute(f'PRAGMA user_version = {_LSH_LAYOUT}')
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def add_texts(self, items, source):
+        """Index (doc_key, label, text) items, skipping keys already indexed"""
+        conn = self._connect()
+        added = 0
+        conn.execute('BEGIN')
+        try:
+            for doc_key, label, text in items:
+                parts = windows(words(text), INDEX_STRIDE)
+                if not parts:
+                    continue
+                cursor = conn.execute('INSERT OR IGNORE INTO documents (doc_key, source, label) VALUES (?, ?, ?)',
+                                      (doc_key, source, label))
+                if not cursor.rowcount:
+                    continue
+                doc_id = cursor.lastrowid
+                for part in parts:
+                    signature = minhash(shingles(part))
+                    window_id = conn.execute('INSERT INTO windows (doc_id, signature) VALUES (?, ?)',
+                                             (doc_id, signature.tobytes())).lastrowid
+                    conn.executemany('INSERT OR IGNORE INTO bands (band, bucket, window_id) VALUES (?, ?, ?)',
+                                     [(band, bucket, window_id)
+                                      for band, bucket in enumerate(band_buckets(signature))])
+                added += 1
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return added
+
+    def add_papers(self, papers, source='core'):
+        """Index the abstracts of papers in search result format"""
+        return self.add_texts([(paper_key(paper), paper.get('title'), paper.get('abstract'))
+                               for paper in papers if paper.get('abstract')], source)
+
+    def add_document(self, content_hash, filename, text, analysis):
+        """Index the full text of an analysed upload"""
+        return self.add_texts([(f'upload:{content_hash}', filename, text)], 'upload')
+
+    def check(self, text, limit=MAX_MATCHES):
+        """Return (similarity, matches) for text against the indexed corpus.
+
+        Similarities are the percentage of the text's windows that match a
+        window of a source, overall and per source, so copying a paragraph
+        of a long paper scores as high as copying a short abstract.
+        """
+        parts = windows(words(text), QUERY_STRIDE)
+        if not parts:
+            return 0, []
+        signatures = [minhash(shingles(part)) for part in parts]
+
+        # Query windows filed under each (band, bucket)
+        buckets = {}
+        for part, signature in enumerate(signatures):
+            for band, bucket in enumerate(band_buckets(signature)):
+                buckets.setdefault((band, bucket), []).append(part)
+
+        conn = self._connect()
+        collisions = {}
+        pairs = {}
+        keys = list(buckets)
+        for start in range(0, len(keys), BUCKET_BATCH):
+            batch = keys[start:start + BUCKET_BATCH]
+            for band, bucket, window_id in conn.execute(
+                    f'''SELECT band, bucket, window_id FROM (
+                            SELECT b.band, b.bucket, b.window_id,
+                                   ROW_NUMBER() OVER (PARTITION BY b.band, b.bucket) AS n
+                            FROM (VALUES {",".join(["(?, ?)"] * len(batch))}) q
+                            JOIN bands b ON b.band = q.column1 AND b.bucket = q.column2)
+                        WHERE n <= ?''',
+                    [value for key in batch for value in key] + [BUCKET_LIMIT]):
+                members = buckets[(band, bucket)]
+                collisions[window_id] = collisions.get(window_id, 0) + len(members)
+                pairs.setdefault(window_id, set()).update(members)
+        if not collisions:
+            return 0, []
+
+        candidates = sorted(collisions, key=collisions.get, reverse=True)[:MAX_CANDIDATES]
+        rows = conn.execute(
+            f'''SELECT w.id, w.doc_id, d.source, d.label, w.signature FROM windows w
+                JOIN documents d ON d.id = w.doc_id
+                WHERE w.id IN ({",".join("?" * len(candidates))})''',
+            candidates).fetchall()
+
+        # Estimated Jaccard similarity of the window pairs that share a band
+        query_signatures = np.stack(signatures)
+        candidate_signatures = np.stack([np.frombuffer(row[4], dtype=np.uint32) for row in rows])
+        pair_parts = np.array([part for row in rows for part in pairs[row[0]]], dtype=np.intp)
+        pair_rows = np.array([number for number, row in enumerate(rows) for _ in pairs[row[0]]], dtype=np.intp)
+
+        covered = {}
+        sources = {}
+        for start in range(0, len(pair_parts), COMPARE_BLOCK):
+            block = pair_parts[start:start + COMPARE_BLOCK]
+            numbers = pair_rows[start:start + COMPARE_BLOCK]
+            similarity = (query_signatures[block] == candidate_signatures[numbers]).mean(axis=1)
+            matched = similarity >= WINDOW_MATCH
+            for part, number in zip(block[matched].tolist(), numbers[matched].tolist()):
+                _, doc_id, source, label, _ = rows[number]
+                covered.setdefault(doc_id, set()).add(part)
+                sources[doc_id] = (source, label)
+
+        matches = []
+        for doc_id, hits in covered.items():
+            share = len(hits) / len(parts)
+            if share >= MIN_SIMILARITY:
+                source, label = sources[doc_id]
+                matches.append({'source': label, 'type': source, 'similarity': round(share * 100)})
+        matches.sort(key=lambda match: match['similarity'], reverse=True)
+        overall = len(set().union(*covered.values())) / len(parts) if covered else 0
+        return round(overall * 100), matches[:limit]
+
+    def stats(self):
+        return {'documents': self._connect().execute('SELECT COUNT(*) FROM documents').fetchone()[0]}
@@ -0,0 +1,23 @@
+"""Entrypoint of render processes, so starting one never imports the app.
+
+RenderQueue writes the job as JSON {"kind", "params", "output_path",
+"quality"} to stdin and passes a file descriptor as the only argument;
+the outcome is written to it as JSON {"error", "glyphs"}.
+"""
+import os
+import sys
+import json
+from video_renderer import render_scene
+
+def main():
+    job = json.load(sys.stdin)
+    try:
+        glyphs = render_scene(job['kind'], job['params'], job['output_path'], job['quality'])
+        result = {'error': None, 'glyphs': glyphs}
+    except Exception as e:
+        result = {'error': f"{type(e).__name__}: {str(e)}", 'glyphs': None}
+    with os.fdopen(int(sys.argv[1]), 'w') as f:
+        json.dump(result, f)
+
+if __name__ == '__main__':
+    main()
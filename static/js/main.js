@@ -16,9 +16,99 @@ document.addEventListener('DOMContentLoaded', function() {
             uploadButton.disabled = true;
             uploadProgress.classList.remove('d-none');
             uploadButton.innerHTML = '<span class="spinner-border spinner-border-sm" role="status" aria-hidden="true"></span> Processing...';
+
+            if (uploadForm.dataset.streamUrl && window.ReadableStream && window.TextDecoder) {
+                e.preventDefault();
+                streamUpload();
+            }
         });
     }
 
+    // Show the analysis as the model writes it, then submit the form as
+    // usual; the server has cached the result by then, so the analysis
+    // page opens straight away
+    function streamUpload() {
+        const output = document.getElementById('analysisStream');
+        const errorBox = document.getElementById('analysisStreamError');
+        let finished = false;
+        output.textContent = '';
+        output.classList.remove('d-none');
+        errorBox.classList.add('d-none');
+
+        fetch(uploadForm.dataset.streamUrl, {
+            method: 'POST',
+            body: new FormData(uploadForm),
+        })
+        .then(response => {
+            if (!response.ok || !response.body) {
+                throw new Error(`Streaming unavailable (${response.status})`);
+            }
+            return readEventStream(response, (event, data) => {
+                if (event === 'token') {
+                    output.textContent += data;
+                    output.scrollTop = output.scrollHeight;
+                } else if (event === 'status') {
+                    output.textContent = `Analyzing the document in ${data.chunks} sections...`;
+                } else if (event === 'result') {
+                    finished = true;
+                    uploadForm.submit();
+                } else if (event === 'error') {
+                    finished = true;
+                    errorBox.textContent = data.error;
+                    errorBox.classList.remove('d-none');
+                    uploadButton.disabled = false;
+                    uploadProgress.classList.add('d-none');
+                    uploadButton.innerHTML = '<i class="bi bi-upload"></i> Upload and Analyze';
+                }
+            });
+        })
+        .then(() => {
+            if (!finished) {
+                uploadForm.submit();
+            }
+        })
+        .catch(error => {
+            console.error(error);
+            // Fall back to the regular upload, which queues the analysis
+            uploadForm.submit();
+        });
+    }
+
+    // Parse a text/event-stream response body; EventSource only supports GET
+    function readEventStream(response, onEvent) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+
+        function pump() {
+            return reader.read().then(({ done, value }) => {
+                if (done) {
+                    return;
+                }
+                buffer += decoder.decode(value, { stream: true });
+                let boundary;
+                while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                    const message = buffer.slice(0, boundary);
+                    buffer = buffer.slice(boundary + 2);
+                    let event = 'message';
+                    const data = [];
+                    message.split('\n').forEach(line => {
+                        if (line.startsWith('event:')) {
+                            event = line.slice(6).trim();
+                        } else if (line.startsWith('data:')) {
+                            data.push(line.slice(5).trimStart());
+                        }
+                    });
+                    if (data.length) {
+                        onEvent(event, JSON.parse(data.join('\n')));
+                    }
+                }
+                return pump();
+            });
+        }
+        return pump();
+    }
+
     // Citation copy functionality
     const copyButtons = document.querySelectorAll('.copy-citation');
     copyButtons.forEach(button => {
@@ -0,0 +1,76 @@
+import os
+import json
+import hashlib
+import logging
+from cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# Upload cache configuration
+UPLOAD_CACHE_MAX_BYTES = int(os.environ.get("UPLOAD_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+def save_and_hash(file, filepath, chunk_size=64 * 1024):
+    """Save an uploaded file to disk and return the SHA-256 of its bytes"""
+    digest = hashlib.sha256()
+    with open(filepath, 'wb') as out:
+        while True:
+            chunk = file.stream.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+            out.write(chunk)
+    return digest.hexdigest()
+
+def _entry_size(entry):
+    return len(entry['text']) + len(json.dumps(entry['analysis']))
+
+class UploadCache:
+    """Content-addressed cache of extracted text and analysis for uploads.
+
+    Entries are keyed by the SHA-256 of the uploaded bytes. A size-bounded
+    LRU keeps recent entries in memory; the ``Document`` table, written in
+    batches by a DocumentStore, is the persistent tier, so a restart or
+    another worker still gets a hit.
+    """
+
+    def __init__(self, store, max_bytes=UPLOAD_CACHE_MAX_BYTES):
+        self.store = store
+        self.memory = LRUCache(max_bytes=max_bytes, sizeof=_entry_size)
+        self.listeners = []
+
+    def add_listener(self, callback):
+        """Call callback(content_hash, filename, text, analysis) for every new entry"""
+        self.listeners.append(callback)
+
+    def get(self, content_hash):
+        """Return {'filename', 'text', 'analysis'} for a hash, or None"""
+        entry = self.memory.get(content_hash)
+        if entry is not None:
+            return entry
+
+        try:
+            entry = self.store.find(content_hash)
+        except Exception as e:
+            logger.error(f"Upload cache lookup failed: {str(e)}")
+            return None
+        if entry is None:
+            return None
+
+        self.memory.set(content_hash, entry)
+        return entry
+
+    def put(self, content_hash, filename, text, analysis):
+        """Store an extraction and its analysis, queueing the database write"""
+        self.memory.set(content_hash, {
+            'filename': filename,
+            'text': text,
+            'analysis': analysis
+        })
+
+        self.store.save(content_hash, filename, text, analysis)
+
+        for listener in self.listeners:
+            try:
+                listener(content_hash, filename, text, analysis)
+            except Exception as e:
+                logger.error(f"Upload cache listener failed: {str(e)}")
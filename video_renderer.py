@@ -0,0 +1,783 @@
+import os
+import sys
+import json
+import time
+import fcntl
+import queue
+import hashlib
+import itertools
+import shutil
+import logging
+import signal
+import tempfile
+import threading
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from manim import (Scene, Text, MathTex, VGroup, Write, Transform, FadeOut, config, tempconfig,
+                   UP, DOWN, RIGHT, BLUE, RED, GREEN, YELLOW, PURPLE)
+from glyph_cache import GlyphCache
+from jobs import JobStore
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Render queue configuration
+# With no render workers, jobs are queued but never rendered
+RENDER_WORKERS = int(os.environ.get("RENDER_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+RENDER_TIMEOUT = float(os.environ.get("RENDER_TIMEOUT", 900))
+RENDER_POLL_INTERVAL = 0.5
+RENDER_QUALITY = os.environ.get("RENDER_QUALITY", "high")
+RENDER_PREVIEW_QUALITY = os.environ.get("RENDER_PREVIEW_QUALITY", "low")
+RENDER_FINAL_QUALITY = os.environ.get("RENDER_FINAL_QUALITY", RENDER_QUALITY)
+# Segment workers per render; by default the renders share the CPUs between them
+RENDER_SEGMENT_WORKERS = int(os.environ.get("RENDER_SEGMENT_WORKERS",
+                                            max(1, (os.cpu_count() or 1) // max(1, RENDER_WORKERS))))
+RENDER_WORKER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'render_worker.py')
+FFMPEG_BINARY = os.environ.get("FFMPEG_BINARY", "ffmpeg")
+
+# Video storage configuration
+VIDEO_STORAGE_MAX_BYTES = int(os.environ.get("VIDEO_STORAGE_MAX_BYTES", 5 * 1024 * 1024 * 1024))
+VIDEO_PIN_SECONDS = int(os.environ.get("VIDEO_PIN_SECONDS", 900))
+
+# Render settings per quality tier; RENDER_QUALITY_TIERS (JSON) adds or overrides tiers
+QUALITY_TIERS = {
+    'low': {'pixel_height': 480, 'pixel_width': 854, 'frame_rate': 15},
+    'medium': {'pixel_height': 720, 'pixel_width': 1280, 'frame_rate': 30},
+    'high': {'pixel_height': 1080, 'pixel_width': 1920, 'frame_rate': 60},
+}
+QUALITY_TIERS.update(json.loads(os.environ.get("RENDER_QUALITY_TIERS", "{}")))
+
+# Queue priorities, lower renders first
+PRIORITY_PREVIEW = 0
+PRIORITY_FINAL = 1
+
+SUMMARY_SECTIONS = [
+    ('key_points', "Key Points", RED),
+    ('methodology', "Methodology", GREEN),
+    ('findings', "Findings", YELLOW),
+    ('conclusions', "Conclusions", PURPLE)
+]
+
+def _small_title(paper_title):
+    small_title = Text(paper_title, font_size=24, color=BLUE)
+    small_title.to_edge(UP)
+    return small_title
+
+def _play_title(scene, paper_title):
+    # Display title with animation
+    title_text = Text(paper_title, font_size=36, color=BLUE)
+    title_text.to_edge(UP)
+    scene.play(Write(title_text))
+    scene.wait(2)
+
+    # Animate title to smaller size and move to top
+    scene.play(Transform(title_text, _small_title(paper_title)))
+
+def _play_section(scene, small_title, section_title, points, color):
+    # Display section title with animation
+    current_section_title = Text(
+        section_title,
+        font_size=28,
+        color=color
+    ).next_to(small_title, DOWN, buff=0.5)
+
+    scene.play(
+        Write(current_section_title),
+        run_time=1
+    )
+
+    # Display points with enhanced animations
+    current_points = VGroup()
+    for i, point in enumerate(points):
+        # Create bullet point
+        bullet = Text("•", font_size=24).shift(DOWN * (i + 2) * 0.7)
+
+        # Format point text with word wrap
+        words = point.split()
+        lines = []
+        current_line = []
+
+        for word in words:
+            current_line.append(word)
+            if len(' '.join(current_line)) > 60:
+                lines.append(' '.join(current_line[:-1]))
+                current_line = [word]
+
+        if current_line:
+            lines.append(' '.join(current_line))
+
+        # Create text for each line
+        point_text = VGroup()
+        for j, line in enumerate(lines):
+            line_text = Text(
+                line,
+                font_size=20
+            ).next_to(bullet, RIGHT, buff=0.2).shift(DOWN * j * 0.4)
+            point_text.add(line_text)
+
+        point_group = VGroup(bullet, point_text)
+        current_points.add(point_group)
+
+    # Animate points appearing one by one
+    for point in current_points:
+        scene.play(
+            Write(point),
+            run_time=1
+        )
+    scene.wait(3)
+
+    # Clear the section with fade
+    scene.play(
+        FadeOut(current_section_title),
+        *[FadeOut(point) for point in current_points]
+    )
+
+def _play_outro(scene):
+    # Conclusion animation with particles
+    conclusion = Text("Summary Complete", font_size=36, color=BLUE)
+    scene.play(
+        Write(conclusion),
+        run_time=1.5
+    )
+    scene.wait(2)
+    scene.play(FadeOut(conclusion))
+
+class EnhancedSummaryScene(Scene):
+    """Animated walkthrough of a paper's structured summary"""
+
+    def __init__(self, paper_title, sections, **kwargs):
+        self.paper_title = paper_title
+        self.sections = sections
+        super().__init__(**kwargs)
+
+    def construct(self):
+        _play_title(self, self.paper_title)
+        small_title = _small_title(self.paper_title)
+        for key, section_title, color in SUMMARY_SECTIONS:
+            if self.sections.get(key):
+                _play_section(self, small_title, section_title, self.sections[key], color)
+        _play_outro(self)
+
+class SummaryTitleSegment(Scene):
+    """Opening segment of a summary video: the animated paper title"""
+
+    def __init__(self, paper_title, **kwargs):
+        self.paper_title = paper_title
+        super().__init__(**kwargs)
+
+    def construct(self):
+        _play_title(self, self.paper_title)
+
+class SummarySectionSegment(Scene):
+    """One summary section, drawn under the title left by the previous segment"""
+
+    def __init__(self, paper_title, section, points, **kwargs):
+        self.paper_title = paper_title
+        self.section = section
+        self.points = points
+        super().__init__(**kwargs)
+
+    def construct(self):
+        small_title = _small_title(self.paper_title)
+        self.add(small_title)
+        _, section_title, color = next(s for s in SUMMARY_SECTIONS if s[0] == self.section)
+        _play_section(self, small_title, section_title, self.points, color)
+
+class SummaryOutroSegment(Scene):
+    """Closing segment of a summary video"""
+
+    def __init__(self, paper_title, **kwargs):
+        self.paper_title = paper_title
+        super().__init__(**kwargs)
+
+    def construct(self):
+        self.add(_small_title(self.paper_title))
+        _play_outro(self)
+
+class MathScene(Scene):
+    """Writes out a list of LaTeX equations one at a time"""
+
+    def __init__(self, equations, **kwargs):
+        self.equations = equations
+        super().__init__(**kwargs)
+
+    def construct(self):
+        # Title
+        title = Text("Mathematical Visualization", font_size=40)
+        self.play(Write(title))
+        self.wait(1)
+        self.play(FadeOut(title))
+
+        # Display equations one by one
+        for eq in self.equations:
+            math_eq = MathTex(eq, font_size=36)
+            self.play(Write(math_eq))
+            self.wait(2)
+            self.play(FadeOut(math_eq))
+
+SCENES = {
+    'summary': EnhancedSummaryScene,
+    'math': MathScene,
+}
+
+SEGMENT_SCENES = {
+    'summary_title': SummaryTitleSegment,
+    'summary_section': SummarySectionSegment,
+    'summary_outro': SummaryOutroSegment,
+}
+
+def summary_segments(paper_title, sections):
+    """Split a summary video into (kind, params) segments that render independently"""
+    segments = [('summary_title', {'paper_title': paper_title})]
+    for key, _, _ in SUMMARY_SECTIONS:
+        if sections.get(key):
+            segments.append(('summary_section', {'paper_title': paper_title, 'section': key,
+                                                 'points': sections[key]}))
+    segments.append(('summary_outro', {'paper_title': paper_title}))
+    return segments
+
+SEGMENTERS = {
+    'summary': summary_segments,
+}
+
+def render_scene(kind, params, output_path, quality=RENDER_QUALITY):
+    """Render a scene to output_path, in parallel segments where supported.
+
+    Runs in a dedicated child process, so manim's global config is private
+    to this render. Returns glyph cache lookup counts as {'hits', 'misses'}.
+    """
+    if kind in SEGMENTERS and RENDER_SEGMENT_WORKERS > 1:
+        return render_segments(SEGMENTERS[kind](**params), output_path, quality)
+    return _render_single(SCENES[kind], params, output_path, quality, kind)
+
+def render_segments(segments, output_path, quality, workers=RENDER_SEGMENT_WORKERS):
+    """Render segments concurrently, one process each, then join them without re-encoding"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        paths = [os.path.join(temp_dir, f'segment_{i}.mp4') for i in range(len(segments))]
+        # Not forked from the render process, which may have threads by now;
+        # the fork server has manim loaded, so workers skip importing it
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(['video_renderer'])
+        with ProcessPoolExecutor(max_workers=min(workers, len(segments)), mp_context=context) as executor:
+            futures = [executor.submit(_render_single, SEGMENT_SCENES[kind], params, path, quality, kind)
+                       for (kind, params), path in zip(segments, paths)]
+            lookups = [future.result() for future in futures]
+        concat_videos(paths, output_path)
+    return {'hits': sum(l['hits'] for l in lookups), 'misses': sum(l['misses'] for l in lookups)}
+
+def concat_videos(paths, output_path):
+    """Losslessly join videos that share codec settings with ffmpeg's concat demuxer"""
+    list_path = output_path + '.txt'
+    with open(list_path, 'w') as f:
+        for path in paths:
+            f.write("file '{}'\n".format(path.replace("'", "'\\''")))
+    try:
+        result = subprocess.run([FFMPEG_BINARY, '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0',
+                                 '-i', list_path, '-c', 'copy', '-f', 'mp4', output_path],
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg concat failed: {result.stderr.strip()}")
+    finally:
+        os.remove(list_path)
+
+def _render_single(scene_class, params, output_path, quality, name):
+    global _glyph_cache
+    _track_glyph_lookups()
+    del _glyph_lookups[:]
+    glyphs = _glyph_cache = GlyphCache()
+    staging = glyphs.stage()
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            settings = {'media_dir': temp_dir, 'video_dir': temp_dir, 'output_file': name,
+                        'tex_dir': os.path.join(staging, 'tex'), 'text_dir': os.path.join(staging, 'text')}
+            settings.update(QUALITY_TIERS[quality])
+            with tempconfig(settings):
+                scene = scene_class(**params)
+                scene.render()
+                shutil.move(str(scene.renderer.file_writer.movie_file_path), output_path)
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    used = [(kind, filename) for kind, filename, hit in _glyph_lookups if hit]
+    glyphs.publish(staging, used)
+    return {'hits': len(used), 'misses': len(_glyph_lookups) - len(used)}
+
+# (kind, filename, hit) of each glyph looked up by the current render
+_glyph_lookups = []
+_glyph_cache = None
+_glyph_tracking = False
+
+def _track_glyph_lookups():
+    """Link each MathTex and Text SVG from the glyph cache as Manim looks it up.
+
+    Wraps the two places where Manim checks its tex_dir and text_dir, which
+    point at the render's staging directory, and records whether each SVG
+    was already compiled. An unsupported Manim version renders without the
+    glyph cache.
+    """
+    global _glyph_tracking
+    if _glyph_tracking:
+        return
+    _glyph_tracking = True
+    try:
+        from manim.mobject.text import tex_mobject, text_mobject
+        from manim.utils.tex_file_writing import generate_tex_file
+        tex_to_svg_file = tex_mobject.tex_to_svg_file
+        text2svg = text_mobject.Text._text2svg
+    except (ImportError, AttributeError) as e:
+        logger.warning(f"Glyph cache metrics unavailable: {str(e)}")
+        return
+
+    def record(kind, directory, filename):
+        path = os.path.join(directory, filename)
+        hit = os.path.exists(path) or (_glyph_cache is not None and _glyph_cache.fetch(kind, filename, path))
+        _glyph_lookups.append((kind, filename, hit))
+
+    def tracked_tex_to_svg_file(expression, environment=None, tex_template=None):
+        tex_file = generate_tex_file(expression, environment, tex_template)
+        record('tex', tex_file.parent, tex_file.with_suffix('.svg').name)
+        return tex_to_svg_file(expression, environment, tex_template)
+
+    def tracked_text2svg(self, *args, **kwargs):
+        record('text', config.get_dir('text_dir'), self._text2hash(*args, **kwargs) + '.svg')
+        return text2svg(self, *args, **kwargs)
+
+    tex_mobject.tex_to_svg_file = tracked_tex_to_svg_file
+    text_mobject.Text._text2svg = tracked_text2svg
+
+def _terminate(process):
+    """Stop a render process together with the segment workers it started"""
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+    process.wait()
+
+def _check_scene(kind, quality):
+    if kind not in SCENES:
+        raise ValueError(f"Unknown scene kind: {kind}")
+    if quality not in QUALITY_TIERS:
+        raise ValueError(f"Unknown render quality: {quality}")
+
+def render_key(kind, params, quality):
+    """Content hash of a scene's inputs and render quality"""
+    payload = json.dumps({'kind': kind, 'params': params, 'quality': quality}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """SHA-256 of a file's bytes, used as the video's strong ETag"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class RenderCache:
+    """Content-addressed cache and storage manager for rendered videos.
+
+    Videos are named after the hash of their scene inputs and quality, and a
+    JSON manifest next to them records each entry so the cache survives
+    restarts. The manifest is rewritten atomically under a file lock
+    because every gunicorn worker shares it.
+
+    Entries remember when they were last used, and evict() deletes the least
+    recently used videos once the directory outgrows max_bytes. A video is
+    pinned for VIDEO_PIN_SECONDS whenever it is handed to a client, so one
+    that a live job still points at is never evicted.
+    """
+
+    def __init__(self, output_dir, manifest_name='manifest.json', max_bytes=VIDEO_STORAGE_MAX_BYTES):
+        self.output_dir = output_dir
+        self.manifest_path = os.path.join(output_dir, manifest_name)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.evicted_bytes = 0
+
+    def filename_for(self, key, kind, quality):
+        return f'{kind}_{key[:32]}_{quality}.mp4'
+
+    def _read(self):
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            logger.error(f"Corrupt render manifest {self.manifest_path}, starting a new one")
+            return {}
+
+    def _update(self, mutate):
+        with open(self.manifest_path + '.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            manifest = self._read()
+            mutate(manifest)
+            temp_path = self.manifest_path + '.tmp'
+            with open(temp_path, 'w') as f:
+                json.dump(manifest, f)
+            os.replace(temp_path, self.manifest_path)
+            return manifest
+
+    def get(self, key):
+        """Return the manifest entry for a key whose video still exists, and pin it"""
+        entry = self._read().get(key)
+        if entry and os.path.exists(os.path.join(self.output_dir, entry['filename'])):
+            self.hits += 1
+            self.pin(key, entry)
+            return entry
+        self.misses += 1
+        return None
+
+    def put(self, key, filename, **fields):
+        now = time.time()
+        entry = {
+            'filename': filename,
+            'size': os.path.getsize(os.path.join(self.output_dir, filename)),
+            'created': now,
+            'last_access': now,
+            'pinned_until': now + VIDEO_PIN_SECONDS
+        }
+        entry.update(fields)
+
+        def mutate(manifest):
+            # evict() may have adopted the file while this render waited for the lock
+            for other in [other for other, existing in manifest.items()
+                          if existing['filename'] == filename and other != key]:
+                del manifest[other]
+            manifest[key] = entry
+        self._update(mutate)
+        return entry
+
+    def lookup_file(self, filename):
+        """Return (key, entry) for a video filename, or (None, None)"""
+        for key, entry in self._read().items():
+            if entry['filename'] == filename:
+                return key, entry
+        return None, None
+
+    def etag(self, key, entry):
+        """Content hash of a video, computed and recorded on first use for older entries"""
+        if entry.get('etag'):
+            return entry['etag']
+        etag = file_digest(os.path.join(self.output_dir, entry['filename']))
+
+        def mutate(manifest):
+            if key in manifest:
+                manifest[key]['etag'] = etag
+        self._update(mutate)
+        return etag
+
+    def pin(self, key, entry=None):
+        """Mark a video as used now and protect it from eviction for VIDEO_PIN_SECONDS"""
+        now = time.time()
+        entry = entry or self._read().get(key)
+        # Clients poll job status every few seconds; only rewrite the
+        # manifest once half of the current pin has run out
+        if entry is None or entry.get('pinned_until', 0) > now + VIDEO_PIN_SECONDS / 2:
+            return
+
+        def mutate(manifest):
+            if key in manifest:
+                manifest[key].update(last_access=now, pinned_until=now + VIDEO_PIN_SECONDS)
+        self._update(mutate)
+
+    def evict(self, max_bytes=None):
+        """Delete least recently used, unpinned videos until the directory fits in max_bytes"""
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        now = time.time()
+        evicted = []
+
+        def mutate(manifest):
+            self._adopt_untracked(manifest)
+            for key in [key for key, entry in manifest.items()
+                        if not os.path.exists(os.path.join(self.output_dir, entry['filename']))]:
+                del manifest[key]
+
+            total = sum(entry['size'] for entry in manifest.values())
+            by_access = sorted(manifest.items(), key=lambda item: item[1].get('last_access', item[1]['created']))
+            for key, entry in by_access:
+                if total <= max_bytes:
+                    break
+                if entry.get('pinned_until', 0) > now:
+                    continue
+                try:
+                    os.remove(os.path.join(self.output_dir, entry['filename']))
+                except FileNotFoundError:
+                    pass
+                del manifest[key]
+                total -= entry['size']
+                evicted.append(entry)
+
+        self._update(mutate)
+        self._remove_stale_partials()
+        if evicted:
+            self.evictions += len(evicted)
+            self.evicted_bytes += sum(entry['size'] for entry in evicted)
+            logger.info(f"Evicted {len(evicted)} videos from {self.output_dir}")
+        return evicted
+
+    def _adopt_untracked(self, manifest):
+        # Videos rendered before the manifest existed are tracked by filename.
+        # A render that just finished may not be recorded yet, so adopted files
+        # stay pinned for a while after they were written; put() then takes
+        # over the entry
+        tracked = {entry['filename'] for entry in manifest.values()}
+        for name in os.listdir(self.output_dir):
+            if name.endswith('.mp4') and not name.startswith('.') and name not in tracked:
+                try:
+                    stat = os.stat(os.path.join(self.output_dir, name))
+                except FileNotFoundError:
+                    continue
+                manifest[f'file:{name}'] = {'filename': name, 'size': stat.st_size,
+                                            'created': stat.st_mtime, 'last_access': stat.st_mtime,
+                                            'pinned_until': stat.st_mtime + VIDEO_PIN_SECONDS}
+
+    def _remove_stale_partials(self):
+        # Partial renders of a worker that died mid-render are never renamed
+        cutoff = time.time() - 2 * RENDER_TIMEOUT
+        for name in os.listdir(self.output_dir):
+            path = os.path.join(self.output_dir, name)
+            if name.startswith('.') and name.endswith('.part.mp4'):
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def usage(self):
+        """Storage usage for the admin view"""
+        now = time.time()
+        manifest = self._read()
+        entries = sorted(manifest.values(), key=lambda entry: entry.get('last_access', entry['created']))
+        return {
+            'entries': len(manifest),
+            'bytes': sum(entry['size'] for entry in entries),
+            'max_bytes': self.max_bytes,
+            'pinned': sum(1 for entry in entries if entry.get('pinned_until', 0) > now),
+            'oldest_access': entries[0].get('last_access', entries[0]['created']) if entries else None,
+            'evictions': self.evictions,
+            'evicted_bytes': self.evicted_bytes,
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+    def stats(self):
+        return {'entries': len(self._read()), 'hits': self.hits, 'misses': self.misses}
+
+render_seconds = registry.histogram('render_seconds', 'Render job duration by scene kind and outcome',
+                                    ('kind', 'status'))
+
+class RenderQueue:
+    """Queue of Manim renders, each run in its own process.
+
+    RENDER_WORKERS dispatcher threads take jobs off the queue and supervise
+    one render process each. Job state lives in a JobStore, so status and
+    cancellation work from any gunicorn worker; a cancelled render is
+    terminated at the next poll.
+    """
+
+    def __init__(self, output_dir, workers=RENDER_WORKERS, jobs=None, cache=None):
+        self.output_dir = output_dir
+        self.workers = workers
+        self.jobs = jobs or JobStore(namespace='render_jobs')
+        self.cache = cache or RenderCache(output_dir)
+        self.glyphs = GlyphCache()
+        self._inflight = {}
+        self._queue = queue.PriorityQueue()
+        self._counter = itertools.count()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f'render-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, kind, params, quality=RENDER_QUALITY, priority=PRIORITY_FINAL):
+        """Queue a render and return its job.
+
+        A scene that was already rendered with the same inputs and quality
+        returns a finished job for the cached video without touching Manim,
+        and one that is still queued or rendering returns that job.
+        """
+        _check_scene(kind, quality)
+        key = render_key(kind, params, quality)
+        return self._submit(kind, params, quality, priority, key, self.cache.get(key))
+
+    def _submit(self, kind, params, quality, priority, key, entry):
+        # entry is the render cache lookup for key, done once by the caller
+        if entry is not None:
+            logger.debug(f"Render cache hit for {key}")
+            return self.jobs.create(kind=kind, quality=quality, key=key, status='done', progress=1.0,
+                                    video_filename=entry['filename'], cancel_requested=False)
+
+        with self._lock:
+            job_id = self._inflight.get(key)
+            job = self.jobs.get(job_id) if job_id else None
+            if job is not None and job['status'] in ('queued', 'running') and not job.get('cancel_requested'):
+                return job
+
+            job = self.jobs.create(kind=kind, quality=quality, key=key,
+                                   video_filename=None, cancel_requested=False)
+            self._inflight[key] = job['id']
+
+        self._start()
+        self._queue.put((priority, next(self._counter), job['id'], kind, params))
+        return job
+
+    def submit_progressive(self, kind, params, preview=RENDER_PREVIEW_QUALITY, final=RENDER_FINAL_QUALITY):
+        """Queue a fast preview render followed by a full-quality render.
+
+        Returns a job whose status() reports the best video finished so far;
+        previews are rendered ahead of every queued full-quality render.
+        """
+        if preview == final:
+            return self.submit(kind, params, final, PRIORITY_FINAL)
+        _check_scene(kind, final)
+        key = render_key(kind, params, final)
+        entry = self.cache.get(key)
+        if entry is not None:
+            return self._submit(kind, params, final, PRIORITY_FINAL, key, entry)
+        preview_job = self.submit(kind, params, preview, PRIORITY_PREVIEW)
+        final_job = self._submit(kind, params, final, PRIORITY_FINAL, key, None)
+        return self.jobs.create(kind=kind, preview_job_id=preview_job['id'], final_job_id=final_job['id'])
+
+    def status(self, job_id):
+        """Job state, resolving progressive jobs to their best available video"""
+        job = self.jobs.get(job_id)
+        if job is None or 'final_job_id' not in job:
+            if job is not None and job.get('video_filename'):
+                self.cache.pin(job['key'])
+            return job
+
+        preview = self.jobs.get(job['preview_job_id']) or {'status': 'failed'}
+        final = self.jobs.get(job['final_job_id']) or {'status': 'failed'}
+        status = dict(job, error=final.get('error'), video_filename=None, quality=None)
+        if final['status'] == 'done':
+            status.update(status='done', video_filename=final['video_filename'], quality=final['quality'])
+            self.cache.pin(final['key'])
+        elif preview['status'] == 'done':
+            # Keep serving the preview if the full-quality render failed
+            finished = final['status'] in ('failed', 'cancelled')
+            status.update(status='done' if finished else 'preview',
+                          video_filename=preview['video_filename'], quality=preview['quality'])
+            self.cache.pin(preview['key'])
+        elif final['status'] in ('failed', 'cancelled') and preview['status'] in ('failed', 'cancelled'):
+            status['status'] = final['status']
+        else:
+            status['status'] = 'running'
+        return status
+
+    def cancel(self, job_id):
+        """Request cancellation; returns False if the job is unknown or finished"""
+        job = self.jobs.get(job_id)
+        if job is not None and 'final_job_id' in job:
+            cancelled = [self.cancel(job['preview_job_id']), self.cancel(job['final_job_id'])]
+            return any(cancelled)
+        if job is None or job['status'] in ('done', 'failed', 'cancelled'):
+            return False
+        self.jobs.update(job_id, cancel_requested=True)
+        return True
+
+    def stats(self):
+        return {'videos': self.cache.usage(), 'glyphs': self.glyphs.stats(), 'queued': self._queue.qsize()}
+
+    def _cancel_requested(self, job_id):
+        job = self.jobs.get(job_id)
+        return job is None or job.get('cancel_requested')
+
+    def _worker(self):
+        while True:
+            _, _, job_id, kind, params = self._queue.get()
+            job = self.jobs.get(job_id)
+            if job is None:
+                # Expired from the job store while queued
+                logger.error(f"Render job {job_id} is no longer known, skipping it")
+                with self._lock:
+                    for key in [key for key, inflight_id in self._inflight.items() if inflight_id == job_id]:
+                        del self._inflight[key]
+                self._queue.task_done()
+                continue
+            key = job['key']
+            started = time.monotonic()
+            try:
+                self._run(job_id, kind, params, job['quality'], key)
+            except Exception as e:
+                logger.error(f"Render job {job_id} failed: {str(e)}")
+                self.jobs.update(job_id, status='failed', error=str(e))
+            finally:
+                status = (self.jobs.get(job_id) or {}).get('status')
+                render_seconds.observe(time.monotonic() - started, kind=kind, status=status)
+                with self._lock:
+                    if self._inflight.get(key) == job_id:
+                        del self._inflight[key]
+                self._queue.task_done()
+
+    def _run(self, job_id, kind, params, quality, key):
+        if self._cancel_requested(job_id):
+            self.jobs.update(job_id, status='cancelled')
+            return
+
+        video_filename = self.cache.filename_for(key, kind, quality)
+        partial_path = os.path.join(self.output_dir, f'.{job_id}.part.mp4')
+        receiver, sender = os.pipe()
+        started = time.monotonic()
+        try:
+            try:
+                # A fresh interpreter running render_worker, so the app is never
+                # re-imported; its own session lets cancelling stop segment workers
+                process = subprocess.Popen([sys.executable, RENDER_WORKER, str(sender)], stdin=subprocess.PIPE,
+                                           pass_fds=(sender,), start_new_session=True)
+            finally:
+                os.close(sender)
+            self.jobs.update(job_id, status='running', stage='render')
+
+            try:
+                process.stdin.write(json.dumps({'kind': kind, 'params': params, 'output_path': partial_path,
+                                                'quality': quality}).encode())
+                process.stdin.close()
+            except BrokenPipeError:
+                # Exited early; its exit code is reported below
+                pass
+            while True:
+                try:
+                    process.wait(RENDER_POLL_INTERVAL)
+                    break
+                except subprocess.TimeoutExpired:
+                    pass
+                if self._cancel_requested(job_id):
+                    _terminate(process)
+                    self.jobs.update(job_id, status='cancelled')
+                    return
+                if time.monotonic() - started > RENDER_TIMEOUT:
+                    _terminate(process)
+                    raise TimeoutError(f"Render exceeded {RENDER_TIMEOUT}s")
+
+            with os.fdopen(receiver, 'rb', closefd=False) as f:
+                output = f.read()
+            if output:
+                result = json.loads(output)
+                error, glyphs = result['error'], result['glyphs']
+            else:
+                error, glyphs = f"Render process exited with code {process.returncode}", None
+            if error or not os.path.exists(partial_path):
+                raise RuntimeError(error or "Render produced no video")
+
+            etag = file_digest(partial_path)
+            os.replace(partial_path, os.path.join(self.output_dir, video_filename))
+            self.cache.put(key, video_filename, kind=kind, quality=quality, etag=etag)
+            self.cache.evict()
+            self.glyphs.record(glyphs['hits'], glyphs['misses'])
+            self.jobs.update(job_id, status='done', progress=1.0, video_filename=video_filename,
+                             render_time=time.monotonic() - started, glyph_hits=glyphs['hits'],
+                             glyph_misses=glyphs['misses'])
+        finally:
+            os.close(receiver)
+            if os.path.exists(partial_path):
+                os.remove(partial_path)